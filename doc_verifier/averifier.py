@@ -1,236 +1,340 @@
 import os
-import json
-from urllib.parse import urlparse
+import re
+import orjson
+import time
+import random
 import logging
 import asyncio
-from azure.ai.formrecognizer import DocumentAnalysisClient
-from azure.core.credentials import AzureKeyCredential
+import heapq
+from types import SimpleNamespace
+from azure.ai.formrecognizer.aio import DocumentAnalysisClient
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
 from azure.ai.formrecognizer import AnalysisFeature
 from doc_verifier.utils import (
-    extract_signature_tables, extract_signature_pairs, extract_styles, 
-    get_hands_written_spans, get_color_spans, identify_author_and_philips,
-    has_intersection, is_valid_date_format, format_date, extract_page_number,
-    get_pdf_page_number, is_url, get_file_name_and_local_path_from_url
+    get_pdf_page_number, is_url, split_result_by_page, get_page_result, has_signatures, extract_signature_tables, scan_ocr_lines,
+    azure_credentials, create_analysis_client
 )
-from doc_verifier.logging_utils import DocumentError
-from doc_verifier.plot_utils import draw_bounding_boxes_on_pdf
+from doc_verifier.verifier import (
+    check_page_result, check_date_order, 
+    page_image_location, error_bounding_regions, page_response
+)
+from doc_verifier.plot_utils import adraw_bounding_boxes_on_pdf
+from doc_verifier.result_cache import page_cache_key, load_result, save_result
 from doc_verifier import config
 
 
 logger = logging.getLogger("doc_verifier")
 
+_client_cache: dict[tuple[str, str], DocumentAnalysisClient] = {}
+_client_cache_loop = None
 
-def process_page(
-    file_path: str, 
-    file_name: str, 
-    page_number: int,
-    author_date: str = "", 
-    author_cell: dict = None, 
-    philips_date : str = "",
-    philips_cell: dict = None
-    ):
-    logger.debug(f"begin to process page{page_number} of {file_name}")
-    
-    image_url = ""
-    errors = []
-    poller = None
-    
-    endpoint = os.getenv('AZURE_ENDPOINT', 'default_value')
-    key = os.getenv('AZURE_KEY', 'default_value')
-    document_analysis_client = DocumentAnalysisClient(
-        endpoint=endpoint, credential=AzureKeyCredential(key)
-    )
+
+def _get_client() -> DocumentAnalysisClient:
+    """
+    Return the DocumentAnalysisClient shared by the pages verified on the running 
+    event loop, as an aio transport is bound to a single loop.
+    """
+    global _client_cache_loop
+    loop = asyncio.get_running_loop()
+    if loop is not _client_cache_loop:
+        _client_cache.clear()
+        _client_cache_loop = loop
+    credentials = azure_credentials()
+    client = _client_cache.get(credentials)
+    if client is None:
+        client = _client_cache[credentials] = create_analysis_client(DocumentAnalysisClient, credentials)
+    return client
+
+
+async def close_clients():
+    """
+    Close the DocumentAnalysisClients of the running event loop, on server shutdown.
+    """
+    global _client_cache_loop
+    if _client_cache_loop is not asyncio.get_running_loop():
+        return
+    clients = list(_client_cache.values())
+    _client_cache.clear()
+    _client_cache_loop = None
+    for client in clients:
+        await client.close()
+
+
+class AsyncRateLimiter:
+    """
+    Spaces out the calls to Azure so that at most requests_per_second 
+    analyze requests are started, whatever the number of concurrent pages.
+    Each caller reserves the next free time slot; as this happens without 
+    awaiting, no lock is needed on the event loop.
+    """
+    def __init__(self, requests_per_second: float):
+        self.interval = 1 / requests_per_second if requests_per_second > 0 else 0
+        self._next_slot = 0.0
+        
+    async def wait(self):
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+_rate_limiter = AsyncRateLimiter(config.REQUESTS_PER_SECOND)
+
+_global_semaphore = None
+_global_semaphore_loop = None
+
+
+def get_global_semaphore() -> asyncio.Semaphore:
+    """
+    Return the semaphore shared by all documents, so that concurrent requests together 
+    never have more than ANALYZE_CONCURRENCY pages in flight against Azure. It is created 
+    again when the event loop changes, as an asyncio semaphore is bound to a single loop.
+    """
+    global _global_semaphore, _global_semaphore_loop
+    loop = asyncio.get_running_loop()
+    if loop is not _global_semaphore_loop:
+        _global_semaphore = asyncio.Semaphore(config.ANALYZE_CONCURRENCY)
+        _global_semaphore_loop = loop
+    return _global_semaphore
+
+_RETRYABLE_STATUS_CODES = (408, 429, 503)
+_RETRYABLE_MESSAGE = re.compile(r"rate limit|quota", re.IGNORECASE)
+
+
+def _is_retryable(error: Exception) -> bool:
+    error = error.__cause__ or error
+    if isinstance(error, HttpResponseError):
+        return (error.status_code in _RETRYABLE_STATUS_CODES) or bool(_RETRYABLE_MESSAGE.search(str(error)))
+    return isinstance(error, (ServiceRequestError, ServiceResponseError))
+
+
+def _read_bytes(file_path: str) -> bytes:
+    with open(file_path, "rb") as f:
+        return f.read()
+
+
+async def analyze_document(file_path: str, pages: str, features: tuple = (AnalysisFeature.STYLE_FONT,)):
+    """
+    Analyze the given pages of a document with the prebuilt-layout model.
+    Requests are rate limited, and retried with exponential backoff when Azure 
+    throttles them or the connection fails. An analysis that times out is not retried.
+    Args:
+        file_path (str): The url or local path of the document.
+        pages (str): The pages to analyze, e.g. "1" or "1-3".
+        features (tuple): The add-on analysis features to enable.
+    Returns:
+        AnalyzeResult: The result of the analysis.
+    """
+    for attempt in range(config.MAX_RETRIES):
+        await _rate_limiter.wait()
+        try:
+            return await _analyze_document(file_path, pages, features)
+        except Exception as e:
+            if (attempt + 1 == config.MAX_RETRIES) or (not _is_retryable(e)):
+                raise
+            delay = min(config.RETRY_MAX_DELAY, config.RETRY_BASE_DELAY * 2 ** attempt + random.uniform(0, config.RETRY_BASE_DELAY))
+            logger.warning("analyzing page %s of %s failed (%s), retrying in %.1fs", pages, file_path, e, delay)
+            await asyncio.sleep(delay)
+
+
+async def _analyze_document(file_path: str, pages: str, features: tuple):
+    document_analysis_client = _get_client()
     
     try:
         if is_url(file_path):
-            poller = document_analysis_client.begin_analyze_document_from_url(
+            poller = await document_analysis_client.begin_analyze_document_from_url(
                 "prebuilt-layout",
                 document_url=file_path,
-                pages=f"{page_number}",
-                features=[AnalysisFeature.STYLE_FONT]
+                pages=pages,
+                features=list(features) or None
             )
         else:
-            with open(file_path, "rb") as f:
-                poller = document_analysis_client.begin_analyze_document(
-                    "prebuilt-layout",
-                    document=f,
-                    pages=f"{page_number}",
-                    features=[AnalysisFeature.STYLE_FONT]
-                )
+            document = await asyncio.to_thread(_read_bytes, file_path)
+            poller = await document_analysis_client.begin_analyze_document(
+                "prebuilt-layout",
+                document=document,
+                pages=pages,
+                features=list(features) or None
+            )
     except Exception as e:
-        raise FileNotFoundError(f"Failed to verify document: {e}")
+        raise FileNotFoundError(f"Failed to verify document: {e}") from e
+    
+    try:
+        return await asyncio.wait_for(poller.result(), config.ANALYZE_TIMEOUT)
+    except asyncio.TimeoutError:
+        # the analysis is still running on Azure, a retry would submit and bill another one
+        raise TimeoutError(f"analyzing page {pages} timed out after {config.ANALYZE_TIMEOUT:.0f}s") from None
+
+
+async def _load_page_result(file_path: str, page_number: int, features: tuple):
+    """
+    Returns the cached result of a page analyzed with the given features, or None, 
+    together with the cache key the result of such an analysis is stored under.
+    The key depends on the features, so a layout-only result is never served for 
+    a styleFont request.
+    """
+    if not config.USE_RESULT_CACHE or is_url(file_path):
+        return None, None
+    cache_key = await asyncio.to_thread(page_cache_key, file_path, page_number, None, features)
+    return await asyncio.to_thread(load_result, cache_key), cache_key
+
+
+async def analyze_page(file_path: str, file_name: str, page_number: int):
+    """
+    Analyze a single page, reusing the cached result of an identical page if any.
+    With STYLE_FONT_ON_DEMAND, a page is first analyzed with the cheaper layout-only 
+    request, and only the pages with signatures are analyzed again with the font styles, 
+    which are only used to check the signatures and dates; a signed page is then billed twice.
+    """
+    style_features = (AnalysisFeature.STYLE_FONT,)
+    result, cache_key = await _load_page_result(file_path, page_number, style_features)
+    if result is not None:
+        logger.debug("page %s of %s loaded from cache", page_number, file_name)
+        return result
     
-    if not poller:
-        logger.debug(f"page{page_number} of {file_name} can not be parsed")
-        return {
-        "file_name": file_name,
-        "page_number": page_number, 
-        "results": {
-            "author_cell": author_cell,
-            "author_date": author_date,
-            "philips_cell": philips_cell,
-            "philips_date": philips_date,
-            "page_image": image_url,
-            "errors": errors
-            }
-        }
+    if config.STYLE_FONT_ON_DEMAND:
+        layout_result, layout_key = await _load_page_result(file_path, page_number, ())
+        if layout_result is None:
+            layout_result = await analyze_document(file_path, f"{page_number}", features=())
+            if layout_key:
+                await asyncio.to_thread(save_result, layout_key, layout_result)
+        signature_pairs, _ = scan_ocr_lines(layout_result)
+        if not has_signatures(extract_signature_tables(layout_result), signature_pairs):
+            logger.debug("page %s of %s parsed without font styles!", page_number, file_name)
+            return layout_result
     
-    logger.debug(f"page {page_number} of {file_name} parsed!")
+    result = await analyze_document(file_path, f"{page_number}", features=style_features)
+    if cache_key:
+        await asyncio.to_thread(save_result, cache_key, result)
+    logger.debug("page %s of %s parsed!", page_number, file_name)
+    return result
 
-    result = poller.result()
-        
-    page_numbers = extract_page_number(result)
-    signature_tables = extract_signature_tables(result)
-    signature_pairs = extract_signature_pairs(result)
-    hands_written_styles, color_styles = extract_styles(result)
-    hands_written_spans = get_hands_written_spans(hands_written_styles)
-    color_spans = get_color_spans(color_styles)
+
+async def process_document_batch(
+    file_path: str, 
+    file_name: str, 
+    start_page: int, 
+    end_page: int
+    ) -> dict:
+    """
+    Analyze the pages from start_page to end_page in a single request, instead of 
+    one request per page.
+    Args:
+        file_path (str): The path to the document file to be verified.
+        file_name (str): The name of the document file.
+        start_page (int): The first page to analyze.
+        end_page (int): The last page to analyze.
+    Returns:
+        dict: A dictionary where keys are page numbers and values are the single-page results.
+    """
+    logger.debug("begin to process page%s-%s of %s", start_page, end_page, file_name)
     
-    for page_number, ocr_page_number in page_numbers.items():
-        
-        if page_number != ocr_page_number["printed_number"]:
-            error = DocumentError(file_name, ocr_page_number["content"], page_number, ocr_page_number["bounding_regions"], "page number is not valid")
-            errors.append(error)
-            logger.info(error)
+    result = await analyze_document(file_path, f"{start_page}-{end_page}")
     
-    for table_idx, signature_table in enumerate(signature_tables):
-        
-        person_count = 0
-        
-        for person in signature_table["persons"]:
-            if (not person["signature"]["content"]) and (not person["date"]["content"]):
-                continue
-            else:
-                if person['signature']["spans"] and (not has_intersection(person['signature']["spans"], hands_written_spans)):
-                    error = DocumentError(file_name, person['signature']["content"], page_number, person['signature']["bounding_regions"], "signature is not handwritten")
-                    errors.append(error)
-                    logger.info(error)
-                if person['date']["spans"] and (not has_intersection(person['date']["spans"], hands_written_spans)):
-                    error = DocumentError(file_name, person['date']["content"], page_number, person['date']["bounding_regions"], "date is not handwritten")
-                    errors.append(error)
-                    logger.info(error)
-                if person['signature']["spans"] and has_intersection(person['signature']["spans"], color_spans):
-                    error = DocumentError(file_name, person['signature']["content"], page_number, person['signature']["bounding_regions"], "signature is not black")
-                    errors.append(error)
-                    logger.info(error)
-                if person['date']["spans"] and has_intersection(person['date']["spans"], color_spans):
-                    error = DocumentError(file_name, person['date']["content"], page_number, person['date']["bounding_regions"], "date is not black")
-                    errors.append(error)
-                    logger.info(error)
-                if person.get("role") and (person["role"].find("philips") >= 0) and (not is_valid_date_format(person["date"]["content"])) and (page_number > 1):
-                    error = DocumentError(file_name, person['date']["content"], page_number, person['date']["bounding_regions"], "philips date format is invalid") 
-                    errors.append(error)
-                    logger.info(error)
-                person_count += 1
-        
-        if person_count == 0:
-            error = DocumentError(file_name, "", page_number, signature_table["bounding_regions"], "signatures and dates are missing")
-            errors.append(error)
-            logger.info(error)
-
-        if (page_number == 1) and (table_idx == 0) and (person_count > 0):
-            author_cell, author_date, philips_cell, philips_date = identify_author_and_philips(signature_table)
-            if author_cell and (not author_date):
-                error = DocumentError(file_name, author_cell["signature"]["content"], page_number, author_cell["date"]["bounding_regions"], "author date is missing")
-                errors.append(error)
-                logger.info(error)
-            if philips_cell and (not philips_date):
-                error = DocumentError(file_name, philips_cell["signature"]["content"], page_number, philips_cell["date"]["bounding_regions"], "philips date is missing")
-                errors.append(error)
-                logger.info(error)
-            if philips_cell and (not is_valid_date_format(philips_cell["date"]["content"])):
-                error = DocumentError(file_name, philips_cell["date"]["content"], page_number, philips_cell["date"]["bounding_regions"], "philips date format is invalid")
-                errors.append(error)
-                logger.info(error)
-        
-        for person in signature_table["persons"]:
-            formatted_date = format_date(person["date"]["content"])
-            if formatted_date and author_date and (formatted_date < author_date):
-                error = DocumentError(file_name, person["date"]["content"], page_number, person["date"]["bounding_regions"], "date is ahead of author date")
-                errors.append(error)
-                logger.info(error)
-            if formatted_date and philips_date and (formatted_date > philips_date):
-                error = DocumentError(file_name, person["date"]["content"], page_number, person["date"]["bounding_regions"], "date is behind philips date")
-                errors.append(error)
-                logger.info(error)
-            if (page_number > 1) or (table_idx > 0):
-                if (person.get("role", "").find("philips") >= 0) and (not is_valid_date_format(person["date"]["content"])):
-                    error = DocumentError(file_name, person["date"]["content"], page_number, person["date"]["bounding_regions"], "philips date format is invalid")
-                    errors.append(error)
-                    logger.info(error)
-
-    for pair in signature_pairs:
-        if (not pair["signature"]["content"]) and (not pair["date"]["content"]):
-            error = DocumentError(file_name, "", page_number, pair["signature"]["bounding_regions"]+pair["date"]["bounding_regions"], "signatures and dates are missing")
-            errors.append(error)
-            logger.info(error)
-        else:
-            if pair["signature"]["spans"] and (not has_intersection(pair["signature"]["spans"], hands_written_spans)):
-                error = DocumentError(file_name, pair['signature']["content"], page_number, pair['signature']["bounding_regions"], "signature is not handwritten")
-                errors.append(error)
-                logger.info(error)
-            if pair["date"]["spans"] and (not has_intersection(pair["date"]["spans"], hands_written_spans)):
-                error = DocumentError(file_name, pair['date']["content"], page_number, pair['date']["bounding_regions"], "date is not handwritten")
-                errors.append(error)
-                logger.info(error)
-            if pair["signature"]["spans"] and has_intersection(pair["signature"]["spans"], color_spans):
-                error = DocumentError(file_name, pair['signature']["content"], page_number, pair['signature']["bounding_regions"], "signature is not black")
-                errors.append(error)
-                logger.info(error)
-            if pair["date"]["spans"] and has_intersection(pair["date"]["spans"], color_spans):
-                error = DocumentError(file_name, pair['date']["content"], page_number, pair['date']["bounding_regions"], "date is not black")
-                errors.append(error)
-                logger.info(error)
-            formatted_date = format_date(pair["date"]["content"])
-            if formatted_date and author_date and (formatted_date < author_date):
-                error = DocumentError(file_name, pair["date"]["content"], page_number, pair["date"]["bounding_regions"], "date is ahead of author date")
-                errors.append(error)
-                logger.info(error)
-            if formatted_date and philips_date and (formatted_date > philips_date):
-                error = DocumentError(file_name, pair["date"]["content"], page_number, pair["date"]["bounding_regions"], "date is behind philips date")
-                errors.append(error)
-                logger.info(error)
-                
-    if errors:
-        bounding_regions = [i.bounding_regions for i in errors]
-        bounding_regions = [(idx, item) for idx, sublist in enumerate(bounding_regions) for item in sublist]
+    logger.debug("page %s-%s of %s parsed!", start_page, end_page, file_name)
+    
+    return split_result_by_page(result)
+
+
+async def abuild_page_response(
+    checks: SimpleNamespace,
+    file_path: str, 
+    file_name: str, 
+    author_date: str = "", 
+    author_cell: dict = None, 
+    philips_date : str = "",
+    philips_cell: dict = None
+    ) -> dict:
+    """
+    Same as verifier.build_page_response, but the bounding boxes are drawn in the 
+    render process pool, so the pages of a document are rendered in parallel 
+    and the event loop is never blocked by the rasterization.
+    """
+    image_url = ""
+    if checks.errors:
+        page_number = checks.page_number
         try:
-            logger.info(f"start ploting on page{page_number} of {file_name}")
-            image_path = os.path.join(config.IMAGE_PATH, os.path.splitext(file_name)[0], f"page{page_number}.png")
-            local_file_path, _ = get_file_name_and_local_path_from_url(file_path)
-            draw_bounding_boxes_on_pdf(
-                local_file_path, 
-                bounding_regions, 
-                image_path, 
-                page_number
-            )
-            image_url = f"{config.SERVER_API}:{config.PORT}/img/{os.path.splitext(file_name)[0]}/page{page_number}.png"
-            logger.info(f"image saved for page{page_number} of {file_name}")
+            logger.info("start ploting on page%s of %s", page_number, file_name)
+            image_path, url = page_image_location(file_name, page_number)
+            await adraw_bounding_boxes_on_pdf(file_path, error_bounding_regions(checks.errors), image_path, page_number)
+            image_url = url
+            logger.info("image saved for page%s of %s", page_number, file_name)
         except Exception as e:
-            logger.error(f"Error while drawing bounding boxes on page{page_number} of {file_name}: {e}")
+            logger.error("Error while drawing bounding boxes on page%s of %s: %s", page_number, file_name, e)
+    return page_response(
+        checks, 
+        file_name, 
+        author_date, 
+        author_cell, 
+        philips_date, 
+        philips_cell, 
+        image_url
+        )
+
+
+async def averify_pages_batch(
+    queue: asyncio.Queue,
+    semaphore: asyncio.Semaphore,
+    file_path: str, 
+    file_name: str, 
+    start_page: int, 
+    end_page: int
+    ):
+    author_date = ""
+    author_cell = None
+    philips_date = ""
+    philips_cell = None
+    
+    try:
+        # the slot is only held for the analysis, not while a slow client is reading the queue
+        async with semaphore:
+            page_results = await process_document_batch(file_path, file_name, start_page, end_page)
+    except Exception as e:
+        logger.error("Error processing page %s-%s: %s", start_page, end_page, e)
+        await queue.put({"error": str(e)})
+        return
     
-    response = {
-        "file_name": file_name,
-        "page_number": page_number, 
-        "results": {
-            "author_cell": author_cell,
-            "author_date": author_date,
-            "philips_cell": philips_cell,
-            "philips_date": philips_date,
-            "page_image": image_url,
-            "errors": [error.__dict__ for error in errors] if errors else errors
-            }
-        }
-    return response
+    # the checks run page by page, as the first page gives the author and Philips 
+    # dates, then the error images of all the pages are drawn concurrently
+    responses = []
+    error = None
+    for page_number in range(start_page, end_page + 1):
+        try:
+            page_result = get_page_result(page_results, page_number)
+            checks = check_page_result(page_result, file_name, page_number)
+            if checks.signatures:
+                author_cell, author_date, philips_cell, philips_date = checks.signatures
+            check_date_order(checks, file_name, author_date, philips_date)
+        except Exception as e:
+            logger.error("Error processing page %s: %s", page_number, e)
+            error = e
+            break
+        responses.append(abuild_page_response(
+            checks,
+            file_path, 
+            file_name, 
+            author_date,
+            author_cell,
+            philips_date,
+            philips_cell,
+            ))
+    
+    for result in await asyncio.gather(*responses):
+        logger.debug("page %s of %s results in queue", result['page_number'], file_name)
+        await queue.put(result)
+    if error is not None:
+        await queue.put({"error": str(error)})
 
 
 async def averify_single_file(
     queue: asyncio.Queue,
-    semaphore_number: int,
+    semaphore: asyncio.Semaphore,
     file_path: str, 
     min_pages: int, 
     max_pages: int, 
     start_page: int = 1,
+    buffer_slots: asyncio.Semaphore = None,
     ):
     """
     The function performs the following checks:
@@ -240,79 +344,108 @@ async def averify_single_file(
         - Ensures that dates are within valid ranges relative to author and Philips dates.
     The verification process continues until the specified page range is exhausted or an invalid argument error is encountered.
     Args:
+        queue (asyncio.Queue): The queue the page results are put into.
+        semaphore (asyncio.Semaphore): The semaphore bounding the pages analyzed concurrently, 
+            shared with the other documents being verified (see get_global_semaphore).
         file_path (str): The path to the document file to be verified.
         min_pages (int): The minimum page number to start verification.
         max_pages (int): The maximum page number to end verification.
+        buffer_slots (asyncio.Semaphore): The slots a page takes before being analyzed, 
+            released by the consumer once the page is sent (see averify_pages).
     Returns:
         dict: A dictionary containing the errors, author and Philips dates and cells.
     """
     local_file_path, file_name, num_pages = get_pdf_page_number(file_path)
     processed_image_folder = os.path.join(config.IMAGE_PATH, os.path.splitext(file_name)[0])
     os.makedirs(processed_image_folder, exist_ok=True)
-    logger.debug(f"procssed image will be saved in {processed_image_folder}")
+    logger.debug("procssed image will be saved in %s", processed_image_folder)
     
-    logger.info(f"Begin to analyze {file_name}...")
+    logger.info("Begin to analyze %s...", file_name)
     
     start_page = max(min_pages, start_page)
-    if start_page == 1:
+    
+    if config.USE_BATCH_API:
+        await averify_pages_batch(queue, semaphore, local_file_path, file_name, start_page, min(max_pages, num_pages))
+    else:
+        await averify_pages(queue, semaphore, local_file_path, file_name, start_page, min(max_pages, num_pages), buffer_slots)
+
+    await queue.put(None)
+    
+    logger.info("Complete analyzing %s.", file_name)
+
+
+async def averify_pages(
+    queue: asyncio.Queue,
+    semaphore: asyncio.Semaphore,
+    file_path: str, 
+    file_name: str, 
+    start_page: int, 
+    end_page: int,
+    buffer_slots: asyncio.Semaphore = None
+    ):
+    """
+    Analyze and verify the pages from start_page to end_page concurrently, 
+    putting the page results into the queue as they complete.
+    A page takes one of the buffer_slots before being analyzed, released by the consumer 
+    once the page is sent. Without buffer_slots, all the pages are analyzed at once.
+    """
+    if buffer_slots is None:
+        buffer_slots = asyncio.Semaphore(max(1, end_page - start_page + 1))
+
+    # only the date order checks of the other pages wait for the first page
+    signatures = asyncio.get_running_loop().create_future()
+    if start_page > 1:
+        signatures.set_result(("", None, "", None))
+
+    async def aprocess_with_semaphore(page_number):
         try:
-            result = process_page(local_file_path, file_name, start_page)
-            author_date = result["results"]["author_date"]
-            author_cell = result["results"]["author_cell"]
-            philips_date = result["results"]["philips_date"]
-            philips_cell = result["results"]["philips_cell"]
+            await buffer_slots.acquire()
+            async with semaphore:
+                logger.debug("begin to process page%s of %s", page_number, file_name)
+                result = await analyze_page(file_path, file_name, page_number)
+            checks = check_page_result(result, file_name, page_number)
+            
+            if page_number == 1:
+                author_cell, author_date, philips_cell, philips_date = checks.signatures or (None, "", None, "")
+                signatures.set_result((author_date, author_cell, philips_date, philips_cell))
+            else:
+                first_page = await signatures
+                if first_page is None:
+                    # the first page failed and the stream is cancelled
+                    return
+                author_date, author_cell, philips_date, philips_cell = first_page
+                
+            check_date_order(checks, file_name, author_date, philips_date)
+            result = await abuild_page_response(
+                checks,
+                file_path, 
+                file_name, 
+                author_date,
+                author_cell,
+                philips_date,
+                philips_cell,
+                )
             
-            logger.debug(f"page {start_page} of {file_name} results in queue")
+            logger.debug("page %s of %s results in queue", page_number, file_name)
             
             await queue.put(result)
-            start_page += 1
         except Exception as e:
-            logger.error(f"Error processing page {start_page}: {e}")
+            if not signatures.done():
+                signatures.set_result(None)
+            logger.error("Error processing page %s: %s", page_number, e)
             await queue.put({"error": str(e)})
-            return
-    else:
-        author_date = ""
-        author_cell = None
-        philips_date = ""
-        philips_cell = None
-    
-    semaphore = asyncio.Semaphore(semaphore_number)
-
-    async def aprocess_with_semaphore(page_number):
-        async with semaphore:
-            try:
-                result = await asyncio.to_thread(
-                    process_page,
-                    local_file_path, 
-                    file_name, 
-                    page_number, 
-                    author_date,
-                    author_cell,
-                    philips_date,
-                    philips_cell,
-                    )
-                
-                logger.debug(f"page {page_number} of {file_name} results in queue")
-                
-                await queue.put(result)
-            except Exception as e:
-                logger.error(f"Error processing page {page_number}: {e}")
-                await queue.put({"error": str(e)})
 
     tasks = [
         aprocess_with_semaphore(page_number)
-        for page_number in range(start_page, min(max_pages, num_pages) + 1)
+        for page_number in range(start_page, end_page + 1)
     ]
     
     await asyncio.gather(*tasks)
-
-    await queue.put(None)
     
-    logger.info(f"Complete analyzing {file_name}.")
     
-    
-async def asend_single_file_result(queue: asyncio.Queue, next_page = 1):
-    results_buffer = {}  
+async def asend_single_file_result(queue: asyncio.Queue, next_page = 1, buffer_slots: asyncio.Semaphore = None):
+    # min-heap of the (page_number, result) received ahead of next_page
+    results_buffer = []
     while True:
         result = await queue.get()
         if not result:
@@ -320,44 +453,54 @@ async def asend_single_file_result(queue: asyncio.Queue, next_page = 1):
         if "error" in result:
             yield f"data: {{\"task cancelled\": \"{result['error']}\"}}\n\n"
             break
-        page_number = result["page_number"]
-        results_buffer[page_number] = result
+        heapq.heappush(results_buffer, (result["page_number"], result))
 
-        while next_page in results_buffer:
+        while results_buffer and (results_buffer[0][0] == next_page):
+            _, result = heapq.heappop(results_buffer)
             
-            logger.debug(f"page {next_page} of {results_buffer[next_page]["file_name"]} sent!")
+            logger.debug("page %s of %s sent!", next_page, result["file_name"])
             
-            yield f"data: {json.dumps(results_buffer.pop(next_page), ensure_ascii=False)}\n\n"
+            yield f"data: {orjson.dumps(result).decode()}\n\n"
             next_page += 1
+            if buffer_slots is not None:
+                buffer_slots.release()
             
             
 async def aprocess_single_file(
     file_path: str, 
     min_pages: int, 
     max_pages: int, 
-    start_page: int = 1,
-    semaphore_number: int = 4
+    start_page: int = 1
     ):
-    queue = asyncio.Queue()
+    # at most SSE_BUFFER_PAGES pages are analyzed ahead of the client: a page takes a slot 
+    # before its analysis, which is released once the page is sent, so a slow client 
+    # holds back the Azure calls instead of piling up the page results
+    buffer_slots = asyncio.Semaphore(config.SSE_BUFFER_PAGES)
+    queue = asyncio.Queue(maxsize=config.SSE_BUFFER_PAGES)
     producer_task = asyncio.create_task(
         averify_single_file(
             queue, 
-            semaphore_number, 
+            get_global_semaphore(), 
             file_path, 
             min_pages, 
             max_pages, 
-            start_page
+            start_page,
+            buffer_slots
             )
         )
     
     try:
-        async for result in asend_single_file_result(queue, start_page):
+        async for result in asend_single_file_result(queue, start_page, buffer_slots):
             yield result
             if "task cancelled" in result:
                 producer_task.cancel() 
                 break
     finally:
-        await producer_task
+        # the producer is stopped when the client disconnects, as it would wait forever on the full queue;
+        # it may also have been cancelled above, which is not an error of the stream
+        if not producer_task.done():
+            producer_task.cancel()
+        await asyncio.gather(producer_task, return_exceptions=True)
             
 
 # def verify_multiple_files(files_dict: dict, min_pages: int, max_pages: int, document_analysis_client: DocumentAnalysisClient) -> dict:
@@ -4,6 +4,16 @@ MIN_PAGES = 1
 
 MAX_PAGES = 3
 
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+DOWNLOAD_CHUNK_SIZE = 1 << 18
+
+MAX_RETRIES = 3
+
+RETRY_BASE_DELAY = 1.0
+
+RETRY_MAX_DELAY = 30.0
+
 if "LOG_PATH" in os.environ:
     LOG_PATH = os.environ["LOG_PATH"]
 else:
@@ -27,4 +37,80 @@ else:
 if "PORT" in os.environ:
     PORT = os.environ["PORT"]
 else:
-    PORT = 4501
\ No newline at end of file
+    PORT = 4501
+    
+if "USE_BATCH_API" in os.environ:
+    USE_BATCH_API = os.environ["USE_BATCH_API"].lower() in ("1", "true", "yes")
+else:
+    USE_BATCH_API = False
+    
+if "REQUESTS_PER_SECOND" in os.environ:
+    REQUESTS_PER_SECOND = float(os.environ["REQUESTS_PER_SECOND"])
+else:
+    REQUESTS_PER_SECOND = 15.0
+    
+if "ANALYZE_CONCURRENCY" in os.environ:
+    ANALYZE_CONCURRENCY = int(os.environ["ANALYZE_CONCURRENCY"])
+else:
+    ANALYZE_CONCURRENCY = 4
+    
+if ANALYZE_CONCURRENCY < 1:
+    raise ValueError(f"ANALYZE_CONCURRENCY must be at least 1, not {ANALYZE_CONCURRENCY}")
+    
+if "CACHE_PATH" in os.environ:
+    CACHE_PATH = os.environ["CACHE_PATH"]
+else:
+    # under the data volume, next to the uploaded documents the results come from
+    CACHE_PATH = os.path.join(DATA_PATH, "cache")
+    
+if "USE_RESULT_CACHE" in os.environ:
+    USE_RESULT_CACHE = os.environ["USE_RESULT_CACHE"].lower() in ("1", "true", "yes")
+else:
+    # off by default, the cache keeps the OCR content of the documents on disk without eviction
+    USE_RESULT_CACHE = False
+    
+if "STYLE_FONT_ON_DEMAND" in os.environ:
+    STYLE_FONT_ON_DEMAND = os.environ["STYLE_FONT_ON_DEMAND"].lower() in ("1", "true", "yes")
+else:
+    STYLE_FONT_ON_DEMAND = False
+    
+if "IMAGE_DPI" in os.environ:
+    IMAGE_DPI = int(os.environ["IMAGE_DPI"])
+else:
+    IMAGE_DPI = 72
+    
+if "IMAGE_FORMAT" in os.environ:
+    IMAGE_FORMAT = os.environ["IMAGE_FORMAT"].lower()
+else:
+    IMAGE_FORMAT = "png"
+    
+if IMAGE_FORMAT not in ("png", "jpg", "jpeg"):
+    raise ValueError(f"IMAGE_FORMAT must be png, jpg or jpeg, not {IMAGE_FORMAT!r}")
+    
+if "IMAGE_QUALITY" in os.environ:
+    IMAGE_QUALITY = int(os.environ["IMAGE_QUALITY"])
+else:
+    IMAGE_QUALITY = 85
+    
+if "RENDER_WORKERS" in os.environ:
+    RENDER_WORKERS = int(os.environ["RENDER_WORKERS"])
+else:
+    RENDER_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+    
+if "VERIFY_WORKERS" in os.environ:
+    VERIFY_WORKERS = int(os.environ["VERIFY_WORKERS"])
+else:
+    VERIFY_WORKERS = 8
+    
+if "ANALYZE_TIMEOUT" in os.environ:
+    ANALYZE_TIMEOUT = float(os.environ["ANALYZE_TIMEOUT"])
+else:
+    ANALYZE_TIMEOUT = 300.0
+    
+if "SSE_BUFFER_PAGES" in os.environ:
+    SSE_BUFFER_PAGES = int(os.environ["SSE_BUFFER_PAGES"])
+else:
+    SSE_BUFFER_PAGES = 4
+    
+if SSE_BUFFER_PAGES < 1:
+    raise ValueError(f"SSE_BUFFER_PAGES must be at least 1, not {SSE_BUFFER_PAGES}")
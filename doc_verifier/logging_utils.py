@@ -1,10 +1,12 @@
-import json
+import orjson
 import logging
 import logging.config
 import pathlib
+from dataclasses import dataclass
 from doc_verifier import config
 
 
+@dataclass(slots=True, repr=False)
 class DocumentError:
     """
     A class to represent an error found in a document.
@@ -22,38 +24,36 @@ class DocumentError:
     error_type : str
         The type of error found in the document.
 
+    Being a dataclass, it is serialized natively by orjson, in the order of the fields.
+
     Methods:
     --------
     __repr__():
         Returns a string representation of the DocumentError instance.
     """
-    def __init__(self, file_name, content, page_number, bounding_regions, error_type):
-        self.file_name = file_name
-        self.content = content
-        self.page_number = page_number
-        self.bounding_regions = bounding_regions
-        self.error_type = error_type
+    file_name: str
+    content: str
+    page_number: int
+    bounding_regions: list
+    error_type: str
 
     def __repr__(self):
-        return json.dumps(
+        return orjson.dumps(
             {
                 "file_name": self.file_name,
                 "error_type": self.error_type, 
                 "page_number": self.page_number, 
                 "content": self.content, 
                 "bounding_regions": self.bounding_regions
-            },
-            ensure_ascii=False
-        )
+            }
+        ).decode()
         
 
 def setup_logging(fpath: str) -> dict:
     config_file = pathlib.Path(fpath)
-    logging_config = None
-    with open(config_file) as f:
-        file_content = f.read()
-        logging_config = json.loads(file_content.replace("{LOG_PATH}", config.LOG_PATH))
-        logging.config.dictConfig(logging_config)
+    file_content = config_file.read_bytes()
+    logging_config = orjson.loads(file_content.replace(b"{LOG_PATH}", config.LOG_PATH.encode()))
+    logging.config.dictConfig(logging_config)
 
     logger = logging.getLogger("doc_verifier")
     logger.info('doc_verifier logging configured')
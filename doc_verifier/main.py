@@ -1,15 +1,19 @@
 import os
+import asyncio
+import mimetypes
 import logging
 import signal
 import time
 import sys
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, StreamingResponse
 from doc_verifier.logging_utils import setup_logging
 from doc_verifier import config
 from doc_verifier.verifier import process_single_file
-from doc_verifier.averifier import aprocess_single_file
+from doc_verifier.averifier import aprocess_single_file, close_clients
+from doc_verifier.plot_utils import get_render_pool, shutdown_render_pool
 from doc_verifier.domain import DocVerifierRequest, DocUploadResponse
 
 
@@ -17,18 +21,24 @@ min_pages = config.MIN_PAGES
 max_pages = config.MAX_PAGES
 
 
+logger = logging.getLogger("doc_verifier")
+
+
 def signal_handler(sig, frame):
     logger.info('Interrupt received, shutting down...')
     sys.exit(0)
 
-signal.signal(signal.SIGINT, signal_handler)
-
 
-logging_config = setup_logging(os.path.join("logging_config", "logging_config.json"))
-logger = logging.getLogger("doc_verifier")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # a single render pool is shared by all the requests, started with the server
+    get_render_pool()
+    yield
+    await close_clients()
+    shutdown_render_pool()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 
 # Add CORS middleware
@@ -51,7 +61,9 @@ async def get_image(subpath: str):
     if not os.path.exists(file_path) or not os.path.isfile(file_path):
         raise HTTPException(status_code=404, detail="Image not found")
     
-    return FileResponse(file_path, media_type="image/png")
+    # the images are png or jpg depending on IMAGE_FORMAT, see plot_utils
+    media_type, _ = mimetypes.guess_type(file_path)
+    return FileResponse(file_path, media_type=media_type or "application/octet-stream")
 
 
 @app.get("/data/{subpath:path}")
@@ -67,6 +79,19 @@ async def get_file(subpath: str):
     return FileResponse(file_path, media_type="application/octet-stream", filename=os.path.basename(file_path))
 
 
+async def save_upload(file: UploadFile, file_path: str):
+    """
+    Stream the uploaded file to disk chunk by chunk, so that a large pdf is never 
+    held in memory and the disk writes do not block the event loop.
+    """
+    f = await asyncio.to_thread(open, file_path, "wb")
+    try:
+        while chunk := await file.read(config.UPLOAD_CHUNK_SIZE):
+            await asyncio.to_thread(f.write, chunk)
+    finally:
+        await asyncio.to_thread(f.close)
+
+
 # @app.post("/upload/")
 # async def upload(file: UploadFile = File(...), ranking: int=1):
 #     if not file.filename.endswith(".pdf"):
@@ -75,9 +100,7 @@ async def get_file(subpath: str):
 
 #     try: 
 #         file_path = os.path.join(config.DATA_PATH, file.filename.replace(" ", ""))
-#         with open(file_path, "wb") as f:
-#             content = await file.read()
-#             f.write(content)
+#         await save_upload(file, file_path)
 #     except Exception as e:
 #         logger.error(f"Error while uploading {file.filename}: {e}")
 #         return DocUploadResponse(file_url="", file_ranking=ranking)
@@ -98,9 +121,7 @@ async def upload(file: UploadFile = File(...), ranking: int = 1):
     try:
         sanitized_filename = file.filename.replace(" ", "_")
         file_path = os.path.join(folder_path, sanitized_filename)
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        await save_upload(file, file_path)
     except Exception as e:
         logger.error(f"Error while uploading {file.filename}: {e}")
         return DocUploadResponse(file_url="", file_ranking=ranking)
@@ -131,5 +152,9 @@ async def averify(query: DocVerifierRequest):
 if __name__ == "__main__":
     import uvicorn
     
+    # the render workers import this script again as __mp_main__, so the process
+    # wide setup only runs here, in the server process
+    signal.signal(signal.SIGINT, signal_handler)
+    logging_config = setup_logging(os.path.join("logging_config", "logging_config.json"))
     logger.info(f'listening at port {config.PORT}')
     uvicorn.run(app, host="0.0.0.0", port=config.PORT, log_config=logging_config)
\ No newline at end of file
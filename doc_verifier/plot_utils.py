@@ -1,46 +1,117 @@
 import os
 import re
-import json
+import mmap
+import shutil
+import orjson
+import asyncio
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import fitz
-from PIL import Image, ImageDraw
-from collections import deque
+from doc_verifier import config
 
 logger = logging.getLogger("doc_verifier")
 
+# The message part of an INFO line, formatted as "[asctime] [levelname] [name] : message"
+_LOG_LINE_PATTERN = re.compile(r'\[[^\]]*\] \[INFO\] \[[^\]]*\] : (.*)')
+_LOG_LINE_BYTES_PATTERN = re.compile(_LOG_LINE_PATTERN.pattern.encode())
+# The error message lines of a log section
+_MESSAGE_LINE_PATTERN = re.compile(rb'^\[[^\]\n]*\] \[INFO\] \[[^\]\n]*\] : (\{[^\n]*"bounding_regions"[^\n]*)$', re.MULTILINE)
+_REQUIRED_FIELDS = frozenset({"file_name", "error_type", "page_number", "content", "bounding_regions"})
 
-def draw_bounding_boxes_on_pdf(pdf_path: str, bounding_regions: list, output_image_path: str, page_number: int):
+_render_pool = None
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """
+    Returns the process pool used to render the error images, creating it on first use.
+    Rasterizing and annotating a page is CPU-bound and holds the GIL, so the pages are 
+    rendered in worker processes. The workers are spawned rather than forked, as the 
+    parent process runs an event loop and holds network clients.
+    """
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(
+            max_workers=config.RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+            )
+    return _render_pool
+
+
+def shutdown_render_pool():
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=True, cancel_futures=True)
+        _render_pool = None
+
+
+async def adraw_bounding_boxes_on_pdf(pdf_path: str, bounding_regions: list, output_image_path: str, page_number: int):
+    """
+    Async version of draw_bounding_boxes_on_pdf, running in the render process pool.
+    Each worker opens the PDF itself, as opened documents can not be shared across processes.
+    With RENDER_WORKERS set to 0 the page is rendered in a thread instead.
+    """
+    if config.RENDER_WORKERS <= 0:
+        return await asyncio.to_thread(draw_bounding_boxes_on_pdf, pdf_path, bounding_regions, output_image_path, page_number)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_render_pool(), 
+        draw_bounding_boxes_on_pdf, 
+        pdf_path, 
+        bounding_regions, 
+        output_image_path, 
+        page_number
+        )
+
+
+def draw_bounding_boxes_on_pdf(pdf, bounding_regions: list, output_image_path: str, page_number: int):
     """
     Draw bounding boxes on the PDF page and save the result as an image.
 
     Args:
-        pdf_path (str): The path to the PDF file.
-        bounding_regions (list): A list of bounding boxes.
+        pdf (str or fitz.Document): The path to the PDF file, or the already opened PDF document.
+        bounding_regions (list): A list of (index, x0, y0, x1, y1) bounding boxes, in inches.
         output_image_path (str): The path to save the output image.
         page_number (int): The page number to draw bounding boxes on.
     """
-    # Open the PDF file
-    document = fitz.open(pdf_path)
-    
-    # Select the page
+    if isinstance(pdf, fitz.Document):
+        draw_bounding_boxes_on_page(pdf, bounding_regions, output_image_path, page_number)
+    else:
+        with fitz.open(pdf) as document:
+            draw_bounding_boxes_on_page(document, bounding_regions, output_image_path, page_number)
+
+
+def draw_bounding_boxes_on_page(document: fitz.Document, bounding_regions: list, output_image_path: str, page_number: int):
+    """
+    Draw bounding boxes on a page of an already opened PDF document and save the result as an image.
+    The boxes are drawn into the page of the opened document, which is left open, 
+    so that it can be reused for the other pages.
+
+    Args:
+        document (fitz.Document): The opened PDF document.
+        bounding_regions (list): A list of (index, x0, y0, x1, y1) bounding boxes, in inches.
+        output_image_path (str): The path to save the output image.
+        page_number (int): The page number to draw bounding boxes on.
+    """
+    # Select the page only, the other pages are never loaded
     page = document.load_page(page_number - 1)  # page_number is 1-based
     
-    # Render the page to an image
-    pix = page.get_pixmap()
-    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+    # Draw the bounding boxes on the page itself, in points, before rendering it.
+    # The polygons are in inches in the displayed orientation of the page, 
+    # the drawing is done in the unrotated page space.
+    derotation = page.derotation_matrix
+    shape = page.new_shape()
+    for idx, x0, y0, x1, y1 in bounding_regions:
+        rect = fitz.Rect(x0*72, y0*72, x1*72, y1*72) * derotation
+        shape.draw_rect(rect)
+        shape.insert_text(fitz.Point(x1*72 + 5, y0*72 + 10) * derotation, str(idx), fontsize=10, color=(1, 0, 0), rotate=page.rotation)
+    shape.finish(color=(1, 0, 0), width=2)
+    shape.commit()
     
-    # Draw the bounding boxes
-    draw = ImageDraw.Draw(img)
-    for idx, bbox in bounding_regions:
-        x0 = bbox["polygon"][0]["x"]*72
-        y0 = bbox["polygon"][0]["y"]*72
-        x1 = bbox["polygon"][2]["x"]*72
-        y1 = bbox["polygon"][2]["y"]*72
-        draw.rectangle([x0, y0, x1, y1], outline="red", width=2)
-        draw.text((x1 + 5, y0), str(idx), fill="red")
-        
-    # Save the image
-    img.save(output_image_path)
+    # Render the annotated page and save it, in the format given by the extension;
+    # the quality only applies to jpg, which is much smaller than png for scanned pages
+    pix = page.get_pixmap(dpi=config.IMAGE_DPI, alpha=False)
+    pix.save(output_image_path, jpg_quality=config.IMAGE_QUALITY)
     
 
 def extract_specific_messages_from_log_file(log_file_path: str,
@@ -58,100 +129,75 @@ def extract_specific_messages_from_log_file(log_file_path: str,
         list: A list of specific messages converted to Python objects.
     """
 
-    buffer = deque()
-    found_end_marker = False
-    start_position = None
-    end_position = None
-    partial_line = b''
-
     with open(log_file_path, 'rb') as log_file:
-        log_file.seek(0, 2)  # Move the cursor to the end of the file
-        file_size = log_file.tell()
-        block_size = 1024
-        blocks = -1
-
-        while file_size > 0:
-            if file_size - block_size > 0:
-                log_file.seek(blocks * block_size, 2)
-                data = log_file.read(block_size)
-            else:
-                log_file.seek(0, 0)
-                data = log_file.read(file_size)
-
-            lines = data.split(b'\n')
-            if partial_line:
-                lines[-1] = lines[-1] + partial_line
-                partial_line = b''
-
-            if data and data[-1] != b'\n':
-                partial_line = lines.pop()
-
-            file_size -= block_size
-            blocks -= 1
-
-            for line in reversed(lines):
-                if line.strip():
-                    decoded_line = line.decode('utf-8')
-                    if end_marker in decoded_line:
-                        found_end_marker = True
-                        end_position = log_file.tell() - len(data) + data.rfind(line) + len(line)
-                    elif start_marker in decoded_line and found_end_marker:
-                        start_position = log_file.tell() - len(data) + data.rfind(line)
-                        break
-
-            if start_position is not None and end_position is not None:
-                break
-
-    if start_position is not None and end_position is not None:
-        with open(log_file_path, 'rb') as log_file:
-            log_file.seek(start_position)
-            data = log_file.read(end_position - start_position)
-            lines = data.split(b'\n')
-
-            for line in lines:
-                if line.strip():
-                    decoded_line = line.decode('utf-8')
-                    if 'INFO' in decoded_line:
-                        buffer.append(decoded_line)
-
-    # Process the specific messages
-    result_messages = []
-    for line in buffer:
-        message = extract_specific_message_from_log(line)
+        try:
+            log_map = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty log file, which can not be mapped
+            return []
+
+        with log_map:
+            # the latest section starts at the last start marker followed by an end marker,
+            # and ends at the first end marker after it
+            end_position = log_map.rfind(end_marker.encode('utf-8'))
+            start_position = log_map.rfind(start_marker.encode('utf-8'), 0, end_position) if end_position >= 0 else -1
+            if start_position < 0:
+                return []
+            end_position = log_map.find(end_marker.encode('utf-8'), start_position)
+            # extend the section to the whole start and end lines
+            start_position = log_map.rfind(b'\n', 0, start_position) + 1
+            end_position = log_map.find(b'\n', end_position)
+            if end_position < 0:
+                end_position = len(log_map)
+            section = log_map[start_position:end_position]
+
+    return list(_iter_messages(section))
+
+
+def _iter_messages(section: bytes):
+    # a single regex scan over the whole section, only the lines with a bounding_regions
+    # JSON message match, and only their message is parsed
+    for match in _MESSAGE_LINE_PATTERN.finditer(section):
+        message = _parse_message(match.group(1))
         if message:
-            result_messages.append(message)
+            yield message
 
-    return result_messages
+def _parse_message(message_str):
+    try:
+        message_dict = orjson.loads(message_str)
+    except orjson.JSONDecodeError:
+        # Skip messages that are not valid JSON
+        return None
+    # Check if the message contains the specific fields
+    if _REQUIRED_FIELDS <= message_dict.keys():
+        return message_dict
+    logger.error(f"Message does not contain all required fields: {message_dict}")
+    return None
 
 def extract_specific_message_from_log(log_line: str):
     """
     Extract the specific message part from a log line and convert it to a Python object.
 
     Args:
-        log_line (str): A single line from the log file.
+        log_line (str or bytes): A single line from the log file.
 
     Returns:
         dict: The specific message part converted to a Python object, or None if it doesn't match the criteria.
     """
-    # Define the regex pattern to extract the message part
-    pattern = r'\[.*?\] \[INFO\] \[.*?\] : (.*)'
-    match = re.search(pattern, log_line)
-    if match:
-        message_str = match.group(1)
-        try:
-            message_dict = json.loads(message_str)
-            # Check if the message contains the specific fields
-            required_fields = {"file_name", "error_type", "page_number", "content", "bounding_regions"}
-            if required_fields.issubset(message_dict.keys()):
-                return message_dict
-            else:
-                logger.error(f"Message does not contain all required fields: {message_dict}")
-                return None
-        except json.JSONDecodeError:
-            # Skip messages that are not valid JSON
+    # cheap substring checks first, most lines are not error messages;
+    # bytes lines are matched and parsed without being decoded
+    if isinstance(log_line, bytes):
+        if (b'"bounding_regions"' not in log_line) or (b'[INFO]' not in log_line):
             return None
-    else:
+        match = _LOG_LINE_BYTES_PATTERN.match(log_line)
+    elif ('"bounding_regions"' not in log_line) or ('[INFO]' not in log_line):
         return None
+    else:
+        match = _LOG_LINE_PATTERN.match(log_line)
+    
+    if match:
+        return _parse_message(match.group(1))
+    return None
     
     
 def clear_path(image_path: str):  
@@ -164,20 +210,17 @@ def clear_path(image_path: str):
         Exception: If an error occurs while deleting a file or directory, it logs the error with the reason.
     """
      
-    if os.path.exists(image_path):
-        for filename in os.listdir(image_path):
-            file_path = os.path.join(image_path, filename)
-            try:
-                if os.path.isfile(file_path) or os.path.islink(file_path):
-                    os.unlink(file_path)
-                elif os.path.isdir(file_path):
-                    for root, dirs, files in os.walk(file_path, topdown=False):
-                        for name in files:
-                            os.remove(os.path.join(root, name))
-                        for name in dirs:
-                            os.rmdir(os.path.join(root, name))
-                    os.rmdir(file_path)
-            except Exception as e:
-                logger.error(f'Failed to delete {file_path}. Reason: {e}')
-    else:
+    try:
+        entries = list(os.scandir(image_path))
+    except FileNotFoundError:
         os.makedirs(image_path)
+        return
+    # the directory itself is kept, as it may be mounted or served while clearing
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.unlink(entry.path)
+        except Exception as e:
+            logger.error(f'Failed to delete {entry.path}. Reason: {e}')
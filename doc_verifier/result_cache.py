@@ -0,0 +1,80 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+from functools import lru_cache
+from azure.ai.formrecognizer import AnalyzeResult
+from doc_verifier.utils import azure_credentials
+from doc_verifier import config
+
+
+logger = logging.getLogger("doc_verifier")
+
+MODEL_ID = "prebuilt-layout"
+FEATURES = ("styleFont",)
+
+
+@lru_cache(maxsize=64)
+def _file_digest(local_file_path: str, mtime_ns: int, size: int) -> str:
+    # the modification time and size are part of the cache key, so a replaced file is hashed again
+    with open(local_file_path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def page_cache_key(local_file_path: str, page_number: int, endpoint: str = None, features: tuple = FEATURES) -> str:
+    """
+    Computes a content-addressed key for the analysis of one page.
+    The file is hashed once, the key of each page combines that digest with 
+    the page number, the endpoint, the model and the features.
+
+    Args:
+        local_file_path (str): The local path to the pdf file.
+        page_number (int): The 1-based page number.
+        endpoint (str): The Azure endpoint analyzing the page, AZURE_ENDPOINT by default.
+        features (tuple): The add-on features requested for the analysis, e.g. () for layout only.
+
+    Returns:
+        str: The sha256 hex digest identifying the page analysis.
+    """
+    stat = os.stat(local_file_path)
+    file_digest = _file_digest(local_file_path, stat.st_mtime_ns, stat.st_size)
+    if endpoint is None:
+        endpoint = azure_credentials()[0]
+    key = f"{file_digest}|{page_number}|{endpoint}|{MODEL_ID}|{','.join(features)}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _cache_file(key: str) -> str:
+    return os.path.join(config.CACHE_PATH, key[:2], f"{key}.json")
+
+
+def load_result(key: str):
+    """
+    Returns the cached AnalyzeResult for the key, or None on a cache miss.
+    """
+    cache_file = _cache_file(key)
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            return AnalyzeResult.from_dict(json.load(f))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"ignoring unreadable cache entry {cache_file}: {e}")
+        return None
+
+
+def save_result(key: str, result) -> None:
+    """
+    Stores the AnalyzeResult under the key. The entry is written to a temporary
+    file first, so concurrent readers never see a partially written entry.
+    """
+    cache_file = _cache_file(key)
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(cache_file))
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(result.to_dict(), f)
+        os.replace(tmp_file, cache_file)
+    except Exception as e:
+        logger.warning(f"failed to cache analysis result {cache_file}: {e}")
@@ -1,14 +1,17 @@
-from collections import deque, defaultdict
-from datetime import datetime
+from datetime import date
+from bisect import bisect_left
+from functools import lru_cache
+from itertools import takewhile
 import re
 import os
+import shutil
 import logging
 import fitz
 import requests
+from azure.core.credentials import AzureKeyCredential
+from types import SimpleNamespace
 from urllib.parse import urlparse
-from typing import List, Dict, Any
-
-from azure.ai.formrecognizer import BoundingRegion
+from typing import List, Dict, Any, Tuple
 
 from doc_verifier import config
 
@@ -16,15 +19,17 @@ from doc_verifier import config
 logger = logging.getLogger("doc_verifier")
 
 
+_URL_RE = re.compile(
+    r'^(?:http|https)://'  # URL 必须以 http:// 或 https:// 开头
+    r'(?:\S+(?::\S*)?@)?'  # 可选的用户认证信息
+    r'(?:[A-Za-z0-9.-]+|\[[A-Fa-f0-9:]+\])'  # 域名或 IP 地址
+    r'(?::\d+)?'  # 可选的端口
+    r'(?:/\S*)?$'  # 可选的路径
+)
+
 def is_url(address):
-    regex = re.compile(
-        r'^(?:http|https)://'  # URL 必须以 http:// 或 https:// 开头
-        r'(?:\S+(?::\S*)?@)?'  # 可选的用户认证信息
-        r'(?:[A-Za-z0-9.-]+|\[[A-Fa-f0-9:]+\])'  # 域名或 IP 地址
-        r'(?::\d+)?'  # 可选的端口
-        r'(?:/\S*)?$'  # 可选的路径
-    )
-    return re.match(regex, address) is not None
+    # local paths are rejected by the prefix alone, without running the regex
+    return address.startswith(("http://", "https://")) and (_URL_RE.match(address) is not None)
 
 
 def get_filename_from_url(url):
@@ -36,12 +41,27 @@ def get_filename_from_url(url):
         return os.path.basename(parsed_url.path)
 
 
+def azure_credentials() -> Tuple[str, str]:
+    # read at each call, not at import, so that a changed environment is picked up
+    return os.getenv('AZURE_ENDPOINT', 'default_value'), os.getenv('AZURE_KEY', 'default_value')
+
+
+def create_analysis_client(client_class, credentials: Tuple[str, str], **kwargs):
+    """
+    Creates a sync or aio DocumentAnalysisClient for the (endpoint, key) credentials.
+    The callers cache it by credentials, so that all the pages reuse its connections.
+    """
+    endpoint, key = credentials
+    return client_class(endpoint=endpoint, credential=AzureKeyCredential(key), **kwargs)
+
+
 def download_file(url, save_path):
-    response = requests.get(url, stream=True)
-    response.raise_for_status()  
-    with open(save_path, "wb") as file:
-        for chunk in response.iter_content(chunk_size=8192):
-            file.write(chunk)
+    # the raw stream is copied in large blocks by shutil, decoding any content encoding
+    with requests.get(url, stream=True) as response:
+        response.raise_for_status()  
+        response.raw.decode_content = True
+        with open(save_path, "wb") as file:
+            shutil.copyfileobj(response.raw, file, length=config.DOWNLOAD_CHUNK_SIZE)
             
             
 def get_file_name_and_local_path_from_url(address):
@@ -55,12 +75,7 @@ def get_file_name_and_local_path_from_url(address):
             
 
 def get_pdf_page_number(address):
-    if is_url(address):
-        filename = get_filename_from_url(address)
-        local_file_path = os.path.join(config.DATA_PATH, filename)
-    else:
-        filename = os.path.basename(address)
-        local_file_path = address
+    local_file_path, filename = get_file_name_and_local_path_from_url(address)
 
     if not os.path.exists(local_file_path):
         if is_url(address): 
@@ -81,54 +96,102 @@ def get_pdf_page_number(address):
     return local_file_path, filename, total_pages
 
 
+# The regex pattern for the date formats
+_DATE_RE = re.compile(r'^\d{1,2}[-.\s]*[A-Za-z]{3}[-.\s]*\d{4}$')
+
+@lru_cache(maxsize=1024)
 def is_valid_date_format(date_str):
-    # Define the regex pattern for the date formats
-    pattern = r'^\d{1,2}[-.\s]*[A-Za-z]{3}[-.\s]*\d{4}$'
-    
-    # Check if the date string matches the pattern
-    if re.match(pattern, date_str):
-        return True
-    return False
+    # Check if the date string matches the pattern, a document only has a handful of distinct dates
+    return _DATE_RE.match(date_str) is not None
+
+_WS_RE = re.compile(r'\s+')
+_COMMA_RE = re.compile(r'[，,]')
+# yyyy-mm-dd, with "-" or "." between the parts, or yyyy/mm/dd
+_NUMERIC_DATE_RE = re.compile(r'^(\d{4})([-./])(\d{1,2})([-./])(\d{1,2})$')
+# dd-mmm-yyyy, with "-", "." or nothing between the parts
+_ALPHA_DATE_RE = re.compile(r'^(\d{1,2})[-.]?([A-Za-z]{3})[-.]?(\d{4})$')
+_MONTHS = {
+    month: idx for idx, month in enumerate(
+        ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], 
+        start=1
+        )
+}
+
+@lru_cache(maxsize=4096)
+def parse_date(date_str: str) -> int:
+    """
+    Parses a date string in one of the accepted formats 
+    (e.g. 2024-01-31, 2024.1.31, 2024/01/31, 31-Jan-2024, 31.jan.2024, 31jan2024) 
+    into an integer of the form YYYYMMDD, which orders like the date.
 
-def format_date(date_str):
+    Args:
+        date_str (str): The date string to parse.
+
+    Returns:
+        int: The date as YYYYMMDD, or 0 if the date string is not recognized.
+    
+    The same dates are repeated across the rows and pages of a document, 
+    so the parsed dates are cached.
+    """
     if not date_str:
-        return ""
+        return 0
     
     # Remove any extra spaces
-    date_str = re.sub(r'\s+', '', date_str)
-    date_str = re.sub(r'[，,]', '.', date_str)
+    date_str = _WS_RE.sub('', date_str)
+    date_str = _COMMA_RE.sub('.', date_str)
     date_str = date_str.strip(".")
     
-    # Define possible date formats
-    date_formats = [
-        "%Y-%m-%d",
-        "%Y-%m.%d",
-        "%Y.%m-%d",
-        "%Y.%m.%d",
-        "%Y/%m/%d",
-        "%d.%b-%Y",
-        "%d.%b.%Y",
-        "%d.%b%Y",
-        "%d-%b-%Y",
-        "%d-%b.%Y",
-        "%d-%b%Y",
-        "%d%b-%Y",
-        "%d%b.%Y",
-        "%d%b%Y",
-    ]
-    
-    for date_format in date_formats:
-        try:
-            # Try to parse the date string
-            date_obj = datetime.strptime(date_str, date_format)
-            # Return the formatted date string
-            return date_obj.strftime("%Y-%m-%d")
-        except ValueError:
-            continue
+    match = _NUMERIC_DATE_RE.match(date_str)
+    if match:
+        year, sep1, month, sep2, day = match.groups()
+        if (sep1 == "/") != (sep2 == "/"):
+            return 0
+        month = int(month)
+    else:
+        match = _ALPHA_DATE_RE.match(date_str)
+        if not match:
+            return 0
+        day, month, year = match.groups()
+        month = _MONTHS.get(month.lower())
+        if not month:
+            return 0
     
-    # If no format matches, raise an error
-    # raise ValueError(f"Date format for '{date_str}' is not recognized")
-    return ""
+    try:
+        # only validates the day of the month, e.g. rejects 2023-02-29
+        date_obj = date(int(year), month, int(day))
+    except ValueError:
+        return 0
+    return date_obj.year * 10000 + date_obj.month * 100 + date_obj.day
+
+@lru_cache(maxsize=4096)
+def format_date(date_str):
+    value = parse_date(date_str)
+    if not value:
+        return ""
+    return f"{value // 10000:04d}-{value // 100 % 100:02d}-{value % 100:02d}"
+
+def _dicts(models) -> list:
+    # the SDK models (spans, regions) as plain dictionaries
+    return [model.to_dict() for model in models]
+
+def _region_dict(polygon, page_number: int) -> dict:
+    # same as BoundingRegion(polygon=polygon, page_number=page_number).to_dict(), without building the model
+    return {"page_number": page_number, "polygon": [point.to_dict() for point in polygon] if polygon else []}
+
+def _column_kind(header: str):
+    """
+    Returns the person field filled by the cells under a signature table header:
+    "name", "role", "signature", "date", or None if the column is ignored.
+    """
+    if ("name" in header) or ("print" in header):
+        return "name"
+    if ("role" in header) or ("title" in header):
+        return "role"
+    if "signature" in header:
+        return "signature"
+    if "date" in header:
+        return "date"
+    return None
 
 def extract_signature_tables(result: Any) -> List[Dict[str, Dict[str, Any]]]:
     """
@@ -158,238 +221,323 @@ def extract_signature_tables(result: Any) -> List[Dict[str, Dict[str, Any]]]:
     """
     signature_tables = []
     for table in result.tables:
-        headers = [cell.content.lower() for cell in table.cells if cell.row_index == 0]
+        # the cells are listed row by row, the headers are the leading cells of row 0
+        headers = [cell.content.lower() for cell in takewhile(lambda cell: cell.row_index == 0, table.cells)]
         if set(headers) >= {"signature", "date"}:
+            # one person per row below the headers, filled in place
+            persons = [{} for _ in range(1, table.row_count)]
             table_dict = {
                 "row_count": table.row_count, 
                 "column_count": table.column_count, 
-                "bounding_regions": [region.to_dict() for region in table.bounding_regions], 
-                "persons": []
+                "bounding_regions": _dicts(table.bounding_regions), 
+                "persons": persons
             }
-            for row_index in range(1, table.row_count):
-                person = {}
-                for cell in table.cells:
-                    if cell.row_index == row_index:
-                        header = headers[cell.column_index]
-                        if (header.find("name") >= 0) or (header.find("print") >= 0):
-                            person["name"] = cell.content.strip().lower()
-                        elif (header.find("role") >= 0) or (header.find("title") >= 0):
-                            person["role"] = cell.content.strip().lower()
-                        elif header.find("signature") >= 0:
-                            person["signature"] = {
-                                "content": cell.content.strip().lower(),
-                                "spans": [span.to_dict() for span in cell.spans],
-                                "bounding_regions": [region.to_dict() for region in cell.bounding_regions]
-                                }
-                        elif header.find("date") >= 0:
-                            person["date"] = {
-                                "content": cell.content.strip().lower(),
-                                "spans": [span.to_dict() for span in cell.spans],
-                                "bounding_regions": [region.to_dict() for region in cell.bounding_regions]
-                                }
-                table_dict[f"persons"].append(person)
+            # the headers are classified once per column, the cells are dispatched by kind
+            column_kinds = [_column_kind(header) for header in headers]
+            # a single pass over the cells, each one is dispatched to the person of its row
+            for cell in table.cells:
+                if not (0 < cell.row_index < table.row_count):
+                    continue
+                person = persons[cell.row_index - 1]
+                kind = column_kinds[cell.column_index]
+                if (kind == "name") or (kind == "role"):
+                    person[kind] = cell.content.strip().lower()
+                elif kind is not None:
+                    person[kind] = {
+                        "content": cell.content.strip().lower(),
+                        "spans": _dicts(cell.spans),
+                        "bounding_regions": _dicts(cell.bounding_regions)
+                        }
             signature_tables.append(table_dict)
     
     return signature_tables
 
-def extract_signature_pairs(result) -> List[Dict[str, Dict[str, Any]]]:
+_COMPLETED_BY = "completed by"
+_COMPLETION_DATE = "completion date"
+# "page 3", "Page: 3 of 10", ... the first number after "page" is the printed page number
+_PAGE_RE = re.compile(r'page\s*[^0-9]*\s*(\d+)', re.IGNORECASE)
+
+def scan_ocr_lines(result) -> Tuple[List[Dict[str, Dict[str, Any]]], Dict[int, Dict[str, Any]]]:
     """
-    Extracts signature and date pairs from the result object.
+    Scans the OCR lines of the result once for both the signature/date pairs and the 
+    printed page numbers, every line is lowercased a single time.
     
     Args:
         result (object): Contains pages and lines to be processed.
     
     Returns:
-        List[Dict[str, Dict[str, Any]]]: Each dictionary contains:
-            - "signature": {
-                "content": str,
-                "spans": List,
-                "bounding_regions": List[Dict[str, Any]]
-            }
-            - "date": {
-                "content": str,
-                "spans": List,
-                "bounding_regions": List[Dict[str, Any]]
-            }
+        tuple: 
+        - The signature and date pairs, a list of dictionaries with the keys 
+          "signature" and "date", each a dictionary with "content" (str), 
+          "spans" (list) and "bounding_regions" (list of dictionaries).
+        - The page numbers, a dictionary where keys are page indices and values 
+          are the extracted page numbers.
     """
-    # Extract signatures and dates
-    signatures = deque()
-    dates = deque()
+    signatures = []
+    dates = []
+    page_numbers = {}
 
-    page_index = 0
-    while page_index < len(result.pages):
-        page = result.pages[page_index]
+    for page in result.pages:
+        lines = page.lines
+        line_count = len(lines)
+        texts = [line.content.lower() for line in lines]
+        
+        for line, text in zip(lines, texts):
+            # most lines do not mention a page, a substring check skips the regex for them
+            match = ("page" in text) and _PAGE_RE.search(line.content.strip())
+            if match:
+                page_numbers[page.page_number] = {
+                    "printed_number": int(match.group(1)),
+                    "content": line.content,
+                    "spans": _dicts(line.spans),
+                    "bounding_regions": [_region_dict(line.polygon, page.page_number)]
+                    }
+                break  # Assuming the page number is unique per page and stopping after finding it
+        
         line_index = 0
-        while line_index < len(page.lines):
-            line = page.lines[line_index]
-            text = line.content.lower()
-            if "completed by" in text:
-                signature_context = text.split("completed by")[-1].strip().lower()
+        while line_index < line_count:
+            line = lines[line_index]
+            text = texts[line_index]
+            # the context follows the last occurrence of the keyword
+            position = text.rfind(_COMPLETED_BY)
+            if position >= 0:
+                signature_context = text[position + len(_COMPLETED_BY):].strip()
                 signature = signature_context[signature_context.find(":")+1:]
-                if (not signature) and (line_index + 1 < len(page.lines)) and (
-                    "completion date" not in page.lines[line_index + 1].content.lower()):
+                if (not signature) and (line_index + 1 < line_count) and (
+                    _COMPLETION_DATE not in texts[line_index + 1]):
                     line_index += 1
-                    line = page.lines[line_index]
-                    signature = line.content.strip().lower()
+                    line = lines[line_index]
+                    signature = texts[line_index].strip()
                 signatures.append((signature, page.page_number, line.polygon, line.spans))
-            elif "completion date" in text:
-                date_context = text.split("completion date")[-1].strip().lower()
+            elif _COMPLETION_DATE in text:
+                date_context = text[text.rfind(_COMPLETION_DATE) + len(_COMPLETION_DATE):].strip()
                 date = date_context[date_context.find(":")+1:]
-                if (not date) and (line_index + 1 < len(page.lines)):
+                if (not date) and (line_index + 1 < line_count):
                     line_index += 1
-                    line = page.lines[line_index]
-                    date = line.content.strip().lower()
+                    line = lines[line_index]
+                    date = texts[line_index].strip()
                 dates.append((date, page.page_number, line.polygon, line.spans))
             line_index += 1
-        page_index += 1
-
-    # Pair signatures with dates
-    pairs = []
-    while signatures and dates:
-        signature, sig_page, sig_polygon, sig_spans = signatures.popleft()
-        date, date_page, date_polygon, date_spans = dates.popleft()
-        pairs.append(
-            {"signature": {
-                "content": signature, 
-                "spans": [span.to_dict() for span in sig_spans],
-                "bounding_regions": [BoundingRegion(polygon=sig_polygon, page_number=sig_page).to_dict()]
-                },    
-             "date": {
-                 "content": date, 
-                 "spans": [span.to_dict() for span in date_spans],
-                 "bounding_regions": [BoundingRegion(polygon=date_polygon, page_number=date_page).to_dict()]
-                 }
+
+    # Pair signatures with dates, in their order of appearance
+    signature_pairs = [
+        {"signature": {
+            "content": signature, 
+            "spans": _dicts(sig_spans),
+            "bounding_regions": [_region_dict(sig_polygon, sig_page)]
+            },    
+         "date": {
+             "content": date, 
+             "spans": _dicts(date_spans),
+             "bounding_regions": [_region_dict(date_polygon, date_page)]
              }
-            )
-        
-    return pairs
+         }
+        for (signature, sig_page, sig_polygon, sig_spans), (date, date_page, date_polygon, date_spans) in zip(signatures, dates)
+    ]
+    return signature_pairs, page_numbers
+
+def has_signatures(signature_tables: List[Dict[str, Any]], signature_pairs: List[Dict[str, Dict[str, Any]]]) -> bool:
+    """
+    Checks if a page has any signature table or signature/date pair, i.e. anything 
+    the handwritten and color checks apply to. Takes the tables and pairs already 
+    extracted, as returned by extract_signature_tables and scan_ocr_lines, so the 
+    page is not scanned again.
+    """
+    return bool(signature_tables or signature_pairs)
+
+def signature_columns(persons: List[Dict[str, Any]]) -> SimpleNamespace:
+    """
+    Transposes the persons of a signature table (or the signature pairs) into
+    parallel lists, so that the checks run over flat lists instead of
+    looking up the nested dictionaries again for every check.
 
-def hex_to_rgb(hex_color):
-    # Convert hex color string to RGB tuple.
-    hex_color = hex_color.lstrip('#')
-    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+    Args:
+        persons: List of dictionaries with "signature" and "date" keys,
+                 as returned by extract_signature_tables or scan_ocr_lines.
 
-def is_blue(rgb_color):
-    # Determine if the given RGB color is in the blue range.
-    r, g, b = rgb_color
-    # Define a threshold to determine if a color is blue
-    # Here we assume a color is blue if the blue component 
-    # is significantly higher than red and green
-    return b > r and b > g
+    Returns:
+        SimpleNamespace with the lists roles, is_philips, sig_contents, sig_spans, sig_regions,
+        date_contents, date_spans, date_regions and date_keys (see parse_date);
+        the i-th entry of each list belongs to the i-th person.
+    """
+    signatures = [person["signature"] for person in persons]
+    dates = [person["date"] for person in persons]
+    date_contents = [date["content"] for date in dates]
+    roles = [person.get("role", "") for person in persons]
+    return SimpleNamespace(
+        roles=roles,
+        # the roles are already lowercase, see extract_signature_tables
+        is_philips=["philips" in role for role in roles],
+        sig_contents=[signature["content"] for signature in signatures],
+        sig_spans=[signature["spans"] for signature in signatures],
+        sig_regions=[signature["bounding_regions"] for signature in signatures],
+        date_contents=date_contents,
+        date_spans=[date["spans"] for date in dates],
+        date_regions=[date["bounding_regions"] for date in dates],
+        date_keys=[parse_date(content) for content in date_contents]
+    )
 
+@lru_cache(maxsize=512)
 def filter_blue_colors(hex_color):
-    # decide if a hex color string represents blue color.
-    rgb_color = hex_to_rgb(hex_color)
-    return is_blue(rgb_color)
-
-def get_styled_text(styles):
-    # Iterate over the styles and merge the spans from each style.
-    spans = [span for style in styles for span in style["spans"]]
-    spans.sort(key=lambda span: span["offset"])
-    return spans
-
-def extract_styles(result):
-    # Group styles by their font attributes
-    hands_written = defaultdict(list)  
-    colors = defaultdict(list)  
-    # Iterate over the styles and group them by their font attributes.
-    for style in result.styles:
-        style = style.to_dict()
-        if style["is_handwritten"]:
-            hands_written[style["is_handwritten"]].append(style)
-        if style["color"]:
-            colors[style["color"]].append(style)
-    return hands_written, colors
+    # decide if a hex color string represents blue color, i.e. its blue component is higher 
+    # than the red and green ones, the color is parsed once as a packed 0xRRGGBB integer, 
+    # and the few colors of a document are cached.
+    value = int(hex_color.lstrip('#'), 16)
+    b = value & 0xFF
+    return b > (value >> 16) & 0xFF and b > (value >> 8) & 0xFF
 
 
-def extract_page_number(result):
+def split_result_by_page(result) -> Dict[int, SimpleNamespace]:
     """
-    Extract page numbers from the OCR recognized text in the result of the azure_document_intelligence prebuilt_layout model.
+    Split the result of a multi-page analysis into single-page results.
 
     Args:
         result: The result object from the azure_document_intelligence prebuilt_layout model.
 
     Returns:
-        dict: A dictionary where keys are page indices and values are the extracted page numbers.
+        dict: A dictionary where keys are page numbers and values are objects exposing the 
+        pages, tables and styles of that page, as expected by the extract_* functions. 
+        Styles are shared by all pages since their spans are offsets into the whole content.
     """
-    page_numbers = {}
-    page_number_patterns = [
-        re.compile(r'page\s*[^0-9]*\s*(\d+)', re.IGNORECASE),
-        re.compile(r'page\s*[^0-9]*\s*(\d+)\s*[^0-9]*\s*\d+', re.IGNORECASE),
-        re.compile(r'page\s*[^0-9]*\s*(\d+)\s*[^0-9]*\s*\d+', re.IGNORECASE),
-        re.compile(r'page\s*[^0-9]*\s*(\d+)\s*[^0-9]*\s*\d+', re.IGNORECASE),
-        re.compile(r'page\s*[^0-9]*\s*(\d+)\s*[^0-9]*\s*\d+', re.IGNORECASE)
-    ]
+    page_results = {
+        page.page_number: SimpleNamespace(pages=[page], tables=[], styles=result.styles)
+        for page in result.pages
+    }
+    for table in result.tables:
+        if table.bounding_regions and (table.bounding_regions[0].page_number in page_results):
+            page_results[table.bounding_regions[0].page_number].tables.append(table)
+    return page_results
 
-    for page in result.pages:
-        for line in page.lines:
-            text = line.content.strip()
-            for pattern in page_number_patterns:
-                match = pattern.search(text)
-                if match:
-                    page_numbers[page.page_number] = {
-                        "printed_number": int(match.group(1)),
-                        "content": line.content,
-                        "spans": [span.to_dict() for span in line.spans],
-                        "bounding_regions": [BoundingRegion(polygon=line.polygon, page_number=page.page_number).to_dict()]
-                        }
-                    break  # Assuming the page number is unique per page and stopping after finding it
-            if page.page_number in page_numbers:
-                break
 
-    return page_numbers
+def get_page_result(page_results: Dict[int, SimpleNamespace], page_number: int) -> SimpleNamespace:
+    """
+    Get the result of a single page from the output of split_result_by_page.
+
+    Args:
+        page_results (dict): The single-page results, by page number.
+        page_number (int): The page number.
+
+    Returns:
+        SimpleNamespace: The result of the page.
+
+    Raises:
+        ValueError: If the page is missing from the analysis result, e.g. a partial analysis, 
+        as it would otherwise be verified as a blank page without any error.
+    """
+    page_result = page_results.get(page_number)
+    if page_result is None:
+        raise ValueError(f"page {page_number} is missing from the analysis result")
+    return page_result
     
 
-def get_color_spans(color_styles):
-    # Extract the spans of text for each color
+def extract_relevant_spans(result) -> Tuple[Dict[bool, List[Dict[str, int]]], Dict[str, List[Dict[str, int]]]]:
+    """
+    Extracts the handwritten and the blue text spans in a single pass over the styles, 
+    only the spans of the kept styles are converted, and the spans are left unsorted 
+    as build_span_index sorts them.
+    Args:
+        result: Object with the styles of the prebuilt-layout model.
+    Returns:
+        tuple: The handwritten spans, keyed by True, and the blue spans, keyed by color.
+    """
+    hands_written_spans = {}
     color_spans = {}
-    for font_color, styles in color_styles.items():
-        if filter_blue_colors(font_color):
-            color_spans[font_color] = get_styled_text(styles)
-    return color_spans
+    for style in result.styles:
+        is_handwritten = style.is_handwritten
+        color = style.color
+        is_blue_color = bool(color) and filter_blue_colors(color)
+        if not (is_handwritten or is_blue_color):
+            continue
+        spans = _dicts(style.spans)
+        if is_handwritten:
+            hands_written_spans.setdefault(True, []).extend(spans)
+        if is_blue_color:
+            color_spans.setdefault(color, []).extend(spans)
+    return hands_written_spans, color_spans
+
+def build_span_index(spans_dict: Dict[str, List[Dict[str, int]]]) -> Tuple[List[int], List[int]]:
+    """
+    Builds a sorted index of all the spans in a dictionary of spans, so that 
+    intersections can be looked up by binary search instead of scanning every span.
+    Overlapping spans are merged, which keeps both the starts and the ends sorted.
+    Args:
+        spans_dict: 
+        A dictionary where keys are span types and values are lists of dictionaries. 
+        Each dictionary in the list represents a span with 'offset' and 'length' keys.
+    Returns:
+        tuple: Two lists with the starts and the ends of the merged spans.
+    """
+    intervals = sorted(
+        (span["offset"], span["offset"] + span["length"])
+        for spans in spans_dict.values() for span in spans
+    )
+    starts, ends = [], []
+    for start, end in intervals:
+        if ends and start < ends[-1]:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
 
-def get_hands_written_spans(hands_written_styles):
-    # Extract the spans of text for each handwriting style
-    hands_written_spans = {}
-    for is_hands_written, styles in hands_written_styles.items():
-        if is_hands_written:
-            hands_written_spans[is_hands_written] = get_styled_text(styles)
-    return hands_written_spans   
-
-def has_intersection(
-    cells: List[Dict[str, int]], 
-    spans_dict: Dict[str, List[Dict[str, int]]]
+def interval_hits(
+    span_index: Tuple[List[int], List[int]],
+    cells: List[Dict[str, int]]
     ) -> bool:
     """
-    Checks if there is any intersection between a list of cells and a dictionary of spans.
+    Checks if there is any intersection between a list of cells and the spans of an index 
+    built by build_span_index, in O(log n) per cell.
     Args:
+        span_index: The starts and ends of the spans, as returned by build_span_index.
         cells: 
         A list of dictionaries where each dictionary represents a cell with the following keys:
         - 'offset' (int): The starting position of the cell.
         - 'length' (int): The length of the cell.
-        spans_dict: 
-        A dictionary where keys are span types and values are lists of dictionaries. 
-        Each dictionary in the list represents a span.
     Returns:
         bool: True if there is any intersection between any cell and any span, False otherwise.
     """
-    if not cells:
-        return False
+    starts, ends = span_index
     for cell in cells:
         cell_offset = cell["offset"]
-        cell_length = cell["length"]
-        cell_end = cell_offset + cell_length
-        for _, spans in spans_dict.items():
-            for span in spans:
-                span_offset = span["offset"]
-                span_length = span["length"]
-                span_end = span_offset + span_length
-                
-                # Check if there is an intersection
-                if not (cell_end <= span_offset or cell_offset >= span_end):
-                    return True
+        cell_end = cell_offset + cell["length"]
+        # the last span starting before the cell ends is the only candidate
+        i = bisect_left(starts, cell_end) - 1
+        if (i >= 0) and (ends[i] > cell_offset):
+            return True
     return False
 
+def classify_spans(
+    spans: List[Dict[str, int]],
+    hands_written_index: Tuple[List[int], List[int]],
+    color_index: Tuple[List[int], List[int]]
+    ) -> Tuple[bool, bool]:
+    """
+    Checks the spans of a cell against the handwritten and the color span indexes 
+    in a single pass, stopping as soon as both are known to intersect.
+    Args:
+        spans: The spans of the cell, as dictionaries with 'offset' and 'length'.
+        hands_written_index: The index of the handwritten spans, from build_span_index.
+        color_index: The index of the colored spans, from build_span_index.
+    Returns:
+        Tuple[bool, bool]: Whether the spans intersect any handwritten span and any colored span,
+        i.e. (interval_hits(hands_written_index, spans), interval_hits(color_index, spans)).
+    """
+    hw_starts, hw_ends = hands_written_index
+    color_starts, color_ends = color_index
+    is_hands_written = is_color = False
+    for span in spans:
+        span_offset = span["offset"]
+        span_end = span_offset + span["length"]
+        if not is_hands_written:
+            i = bisect_left(hw_starts, span_end) - 1
+            is_hands_written = (i >= 0) and (hw_ends[i] > span_offset)
+        if not is_color:
+            i = bisect_left(color_starts, span_end) - 1
+            is_color = (i >= 0) and (color_ends[i] > span_offset)
+        if is_hands_written and is_color:
+            break
+    return is_hands_written, is_color
+
 def identify_author_and_philips(signature_table: dict) -> tuple:
     """
     Identifies the earliest date for an author and the latest date for a Philips representative from a signature table.
@@ -408,21 +556,20 @@ def identify_author_and_philips(signature_table: dict) -> tuple:
             - philips_date (str): The latest date associated with a Philips representative, formatted as a string. 
                                     Returns an empty string if no Philips representative is found.
     """
+    # a single streamed pass keeps the best candidate of each role, with the date of 
+    # every person formatted once; the ISO dates (yyyy-mm-dd) order like the dates.
+    # The first person of a role is kept until one with a valid date is found.
     author_cell, author_date = None, ""
     philips_cell, philips_date = None, ""
     for person in signature_table["persons"]:
-        if person.get("role", "").find("author") >= 0:
-            if not author_cell:
-                author_cell = person
-            formatted_date = format_date(person["date"]["content"])
-            if formatted_date and ((not author_date) or (author_date > formatted_date)):
-                author_cell = person
-                author_date = formatted_date
-        if person.get("role", "").find("philips") >= 0:
-            if not philips_cell:
-                philips_cell = person
-            formatted_date = format_date(person["date"]["content"])
-            if formatted_date and ((not philips_date) or (philips_date < formatted_date)):
-                philips_cell= person
-                philips_date = formatted_date
+        role = person.get("role", "")
+        is_author = "author" in role
+        is_philips = "philips" in role
+        if not (is_author or is_philips):
+            continue
+        date = format_date(person["date"]["content"])
+        if is_author and ((author_cell is None) or (date and ((not author_date) or (date < author_date)))):
+            author_cell, author_date = person, date
+        if is_philips and ((philips_cell is None) or (date and ((not philips_date) or (date > philips_date)))):
+            philips_cell, philips_date = person, date
     return author_cell, author_date, philips_cell, philips_date
\ No newline at end of file
@@ -1,24 +1,112 @@
 import os
-import json
-from urllib.parse import urlparse
+import orjson
 import logging
 import asyncio
+import heapq
+from collections import deque
+from itertools import islice
+import threading
+import fitz
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
 from azure.ai.formrecognizer import DocumentAnalysisClient
-from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import RequestsTransport
 from azure.ai.formrecognizer import AnalysisFeature
 from doc_verifier.utils import (
-    extract_signature_tables, extract_signature_pairs, extract_styles, 
-    get_hands_written_spans, get_color_spans, identify_author_and_philips,
-    has_intersection, is_valid_date_format, format_date, extract_page_number,
-    get_pdf_page_number, is_url, get_file_name_and_local_path_from_url
+    extract_signature_tables, scan_ocr_lines, extract_relevant_spans, identify_author_and_philips,
+    build_span_index, classify_spans, signature_columns, is_valid_date_format, parse_date,
+    get_pdf_page_number, is_url, split_result_by_page, get_page_result, has_signatures,
+    azure_credentials, create_analysis_client
 )
 from doc_verifier.logging_utils import DocumentError
 from doc_verifier.plot_utils import draw_bounding_boxes_on_pdf
+from doc_verifier.result_cache import page_cache_key, load_result, save_result
 from doc_verifier import config
 
 
 logger = logging.getLogger("doc_verifier")
 
+# the config does not change once the server is started
+_IMAGE_PATH = config.IMAGE_PATH
+_IMAGE_URL = f"{config.SERVER_API}:{config.PORT}/img"
+
+# the blocking page verifications of all the /verify/ requests share a bounded pool,
+# instead of the default executor used by every other to_thread caller
+_VERIFY_POOL = ThreadPoolExecutor(max_workers=config.VERIFY_WORKERS, thread_name_prefix="verify")
+
+
+_client_cache: dict[tuple[str, str], DocumentAnalysisClient] = {}
+_client_lock = threading.Lock()
+
+
+def _get_client() -> DocumentAnalysisClient:
+    """
+    Return the DocumentAnalysisClient shared by the verify threads, its session 
+    keeping up to VERIFY_WORKERS connections alive.
+    """
+    credentials = azure_credentials()
+    client = _client_cache.get(credentials)
+    if client is None:
+        with _client_lock:
+            client = _client_cache.get(credentials)
+            if client is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=config.VERIFY_WORKERS, pool_maxsize=config.VERIFY_WORKERS
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                client = _client_cache[credentials] = create_analysis_client(
+                    DocumentAnalysisClient, 
+                    credentials,
+                    transport=RequestsTransport(session=session, session_owner=False)
+                )
+    return client
+
+
+def begin_analysis(file_path: str, pages: str):
+    """
+    Starts the prebuilt-layout analysis of the given pages of a document.
+    Args:
+        file_path (str): The url or the local path of the document.
+        pages (str): The pages to analyze, e.g. "3" or "1-3".
+    Returns:
+        The poller of the analysis.
+    """
+    document_analysis_client = _get_client()
+    
+    try:
+        if is_url(file_path):
+            return document_analysis_client.begin_analyze_document_from_url(
+                "prebuilt-layout",
+                document_url=file_path,
+                pages=pages,
+                features=[AnalysisFeature.STYLE_FONT]
+            )
+        with open(file_path, "rb") as f:
+            return document_analysis_client.begin_analyze_document(
+                "prebuilt-layout",
+                document=f,
+                pages=pages,
+                features=[AnalysisFeature.STYLE_FONT]
+            )
+    except Exception as e:
+        raise FileNotFoundError(f"Failed to verify document: {e}")
+
+
+def wait_for_result(poller, pages: str):
+    """
+    Waits at most ANALYZE_TIMEOUT seconds for the analysis of the given pages, so that 
+    a stalled analysis does not hold a verify thread forever.
+    Raises:
+        TimeoutError: If the analysis is still running after ANALYZE_TIMEOUT seconds.
+    """
+    poller.wait(config.ANALYZE_TIMEOUT)
+    if not poller.done():
+        raise TimeoutError(f"analyzing page {pages} timed out after {config.ANALYZE_TIMEOUT:.0f}s")
+    return poller.result()
+
 
 def process_page(
     file_path: str, 
@@ -27,41 +115,37 @@ def process_page(
     author_date: str = "", 
     author_cell: dict = None, 
     philips_date : str = "",
-    philips_cell: dict = None
+    philips_cell: dict = None,
+    pdf_document: fitz.Document = None
     ):
-    logger.debug(f"begin to process page{page_number} of {file_name}")
+    logger.debug("begin to process page%s of %s", page_number, file_name)
     
     image_url = ""
     errors = []
     poller = None
     
-    endpoint = os.getenv('AZURE_ENDPOINT', 'default_value')
-    key = os.getenv('AZURE_KEY', 'default_value')
-    document_analysis_client = DocumentAnalysisClient(
-        endpoint=endpoint, credential=AzureKeyCredential(key)
-    )
-    
-    try:
-        if is_url(file_path):
-            poller = document_analysis_client.begin_analyze_document_from_url(
-                "prebuilt-layout",
-                document_url=file_path,
-                pages=f"{page_number}",
-                features=[AnalysisFeature.STYLE_FONT]
-            )
-        else:
-            with open(file_path, "rb") as f:
-                poller = document_analysis_client.begin_analyze_document(
-                    "prebuilt-layout",
-                    document=f,
-                    pages=f"{page_number}",
-                    features=[AnalysisFeature.STYLE_FONT]
+    cache_key = None
+    if config.USE_RESULT_CACHE and not is_url(file_path):
+        cache_key = page_cache_key(file_path, page_number)
+        result = load_result(cache_key)
+        if result is not None:
+            logger.debug("page %s of %s loaded from cache", page_number, file_name)
+            return verify_page_result(
+                result, 
+                file_path, 
+                file_name, 
+                page_number, 
+                author_date, 
+                author_cell, 
+                philips_date, 
+                philips_cell,
+                pdf_document
                 )
-    except Exception as e:
-        raise FileNotFoundError(f"Failed to verify document: {e}")
+    
+    poller = begin_analysis(file_path, f"{page_number}")
     
     if not poller:
-        logger.debug(f"page{page_number} of {file_name} can not be parsed")
+        logger.debug("page%s of %s can not be parsed", page_number, file_name)
         return {
         "file_name": file_name,
         "page_number": page_number, 
@@ -75,155 +159,384 @@ def process_page(
             }
         }
     
-    logger.debug(f"page {page_number} of {file_name} parsed!")
+    logger.debug("page %s of %s parsed!", page_number, file_name)
 
-    result = poller.result()
-        
-    page_numbers = extract_page_number(result)
+    result = wait_for_result(poller, f"{page_number}")
+    if cache_key:
+        save_result(cache_key, result)
+    
+    return verify_page_result(
+        result, 
+        file_path, 
+        file_name, 
+        page_number, 
+        author_date, 
+        author_cell, 
+        philips_date, 
+        philips_cell,
+        pdf_document
+        )
+
+
+def check_page_result(result, file_name: str, page_number: int) -> SimpleNamespace:
+    """
+    Runs the checks of a single page that do not depend on the other pages of the 
+    document, i.e. everything but the ordering of the dates against the author and 
+    Philips dates, which are only known once the first page is verified.
+    Args:
+        result: The AnalyzeResult of the prebuilt-layout model for the page.
+        file_name (str): The name of the document file.
+        page_number (int): The page number of the page.
+    Returns:
+        SimpleNamespace: With the attributes
+            - page_number (int): The page number the errors are reported on.
+            - errors (List[DocumentError]): The errors found on the page.
+            - dates (List[tuple]): The (date_key, content, bounding_regions, position) of the signed dates, 
+              for check_date_order, where position is the index in errors their date order errors go at.
+            - signatures (tuple): The (author_cell, author_date, philips_cell, philips_date) 
+              identified on the first page, or None.
+    """
+    errors = []
+    dates = []
+    signatures = None
+    
+    def report(content, bounding_regions, error_type):
+        # page_number is looked up when called, it is rebound by the page number check below
+        error = DocumentError(file_name, content, page_number, bounding_regions, error_type)
+        errors.append(error)
+        logger.info(error)
+    
+    signature_pairs, page_numbers = scan_ocr_lines(result)
     signature_tables = extract_signature_tables(result)
-    signature_pairs = extract_signature_pairs(result)
-    hands_written_styles, color_styles = extract_styles(result)
-    hands_written_spans = get_hands_written_spans(hands_written_styles)
-    color_spans = get_color_spans(color_styles)
     
     for page_number, ocr_page_number in page_numbers.items():
         
         if page_number != ocr_page_number["printed_number"]:
-            error = DocumentError(file_name, ocr_page_number["content"], page_number, ocr_page_number["bounding_regions"], "page number is not valid")
-            errors.append(error)
-            logger.info(error)
+            report(ocr_page_number["content"], ocr_page_number["bounding_regions"], "page number is not valid")
+    
+    if not has_signatures(signature_tables, signature_pairs):
+        # nothing signed on the page, the styles are not needed
+        return SimpleNamespace(page_number=page_number, errors=errors, dates=dates, signatures=signatures)
+    
+    hands_written_spans, color_spans = extract_relevant_spans(result)
+    hands_written_index = build_span_index(hands_written_spans)
+    color_index = build_span_index(color_spans)
     
     for table_idx, signature_table in enumerate(signature_tables):
         
-        person_count = 0
+        persons = signature_columns(signature_table["persons"])
+        filled = [bool(sig or date) for sig, date in zip(persons.sig_contents, persons.date_contents)]
+        sig_classes = [classify_spans(spans, hands_written_index, color_index) for spans in persons.sig_spans]
+        date_classes = [classify_spans(spans, hands_written_index, color_index) for spans in persons.date_spans]
+        is_philips = persons.is_philips
+        person_count = sum(filled)
         
-        for person in signature_table["persons"]:
-            if (not person["signature"]["content"]) and (not person["date"]["content"]):
+        for i in range(len(filled)):
+            if not filled[i]:
                 continue
-            else:
-                if person['signature']["spans"] and (not has_intersection(person['signature']["spans"], hands_written_spans)):
-                    error = DocumentError(file_name, person['signature']["content"], page_number, person['signature']["bounding_regions"], "signature is not handwritten")
-                    errors.append(error)
-                    logger.info(error)
-                if person['date']["spans"] and (not has_intersection(person['date']["spans"], hands_written_spans)):
-                    error = DocumentError(file_name, person['date']["content"], page_number, person['date']["bounding_regions"], "date is not handwritten")
-                    errors.append(error)
-                    logger.info(error)
-                if person['signature']["spans"] and has_intersection(person['signature']["spans"], color_spans):
-                    error = DocumentError(file_name, person['signature']["content"], page_number, person['signature']["bounding_regions"], "signature is not black")
-                    errors.append(error)
-                    logger.info(error)
-                if person['date']["spans"] and has_intersection(person['date']["spans"], color_spans):
-                    error = DocumentError(file_name, person['date']["content"], page_number, person['date']["bounding_regions"], "date is not black")
-                    errors.append(error)
-                    logger.info(error)
-                if person.get("role") and (person["role"].find("philips") >= 0) and (not is_valid_date_format(person["date"]["content"])) and (page_number > 1):
-                    error = DocumentError(file_name, person['date']["content"], page_number, person['date']["bounding_regions"], "philips date format is invalid") 
-                    errors.append(error)
-                    logger.info(error)
-                person_count += 1
+            sig_is_handwritten, sig_is_color = sig_classes[i]
+            date_is_handwritten, date_is_color = date_classes[i]
+            if persons.sig_spans[i] and (not sig_is_handwritten):
+                report(persons.sig_contents[i], persons.sig_regions[i], "signature is not handwritten")
+            if persons.date_spans[i] and (not date_is_handwritten):
+                report(persons.date_contents[i], persons.date_regions[i], "date is not handwritten")
+            if sig_is_color:
+                report(persons.sig_contents[i], persons.sig_regions[i], "signature is not black")
+            if date_is_color:
+                report(persons.date_contents[i], persons.date_regions[i], "date is not black")
+            if is_philips[i] and (page_number > 1) and (not is_valid_date_format(persons.date_contents[i])):
+                report(persons.date_contents[i], persons.date_regions[i], "philips date format is invalid")
         
         if person_count == 0:
-            error = DocumentError(file_name, "", page_number, signature_table["bounding_regions"], "signatures and dates are missing")
-            errors.append(error)
-            logger.info(error)
+            report("", signature_table["bounding_regions"], "signatures and dates are missing")
 
         if (page_number == 1) and (table_idx == 0) and (person_count > 0):
-            author_cell, author_date, philips_cell, philips_date = identify_author_and_philips(signature_table)
+            signatures = identify_author_and_philips(signature_table)
+            author_cell, author_date, philips_cell, philips_date = signatures
             if author_cell and (not author_date):
-                error = DocumentError(file_name, author_cell["signature"]["content"], page_number, author_cell["date"]["bounding_regions"], "author date is missing")
-                errors.append(error)
-                logger.info(error)
+                report(author_cell["signature"]["content"], author_cell["date"]["bounding_regions"], "author date is missing")
             if philips_cell and (not philips_date):
-                error = DocumentError(file_name, philips_cell["signature"]["content"], page_number, philips_cell["date"]["bounding_regions"], "philips date is missing")
-                errors.append(error)
-                logger.info(error)
+                report(philips_cell["signature"]["content"], philips_cell["date"]["bounding_regions"], "philips date is missing")
             if philips_cell and (not is_valid_date_format(philips_cell["date"]["content"])):
-                error = DocumentError(file_name, philips_cell["date"]["content"], page_number, philips_cell["date"]["bounding_regions"], "philips date format is invalid")
-                errors.append(error)
-                logger.info(error)
+                report(philips_cell["date"]["content"], philips_cell["date"]["bounding_regions"], "philips date format is invalid")
         
-        for person in signature_table["persons"]:
-            formatted_date = format_date(person["date"]["content"])
-            if formatted_date and author_date and (formatted_date < author_date):
-                error = DocumentError(file_name, person["date"]["content"], page_number, person["date"]["bounding_regions"], "date is ahead of author date")
-                errors.append(error)
-                logger.info(error)
-            if formatted_date and philips_date and (formatted_date > philips_date):
-                error = DocumentError(file_name, person["date"]["content"], page_number, person["date"]["bounding_regions"], "date is behind philips date")
-                errors.append(error)
-                logger.info(error)
-            if (page_number > 1) or (table_idx > 0):
-                if (person.get("role", "").find("philips") >= 0) and (not is_valid_date_format(person["date"]["content"])):
-                    error = DocumentError(file_name, person["date"]["content"], page_number, person["date"]["bounding_regions"], "philips date format is invalid")
-                    errors.append(error)
-                    logger.info(error)
-
-    for pair in signature_pairs:
-        if (not pair["signature"]["content"]) and (not pair["date"]["content"]):
-            error = DocumentError(file_name, "", page_number, pair["signature"]["bounding_regions"]+pair["date"]["bounding_regions"], "signatures and dates are missing")
+        check_philips_format = (page_number > 1) or (table_idx > 0)
+        for i in range(len(filled)):
+            # the date order errors of a person go before its date format error, see check_date_order
+            dates.append((persons.date_keys[i], persons.date_contents[i], persons.date_regions[i], len(errors)))
+            if check_philips_format and is_philips[i] and (not is_valid_date_format(persons.date_contents[i])):
+                report(persons.date_contents[i], persons.date_regions[i], "philips date format is invalid")
+
+    pairs = signature_columns(signature_pairs)
+    for i in range(len(signature_pairs)):
+        if (not pairs.sig_contents[i]) and (not pairs.date_contents[i]):
+            report("", pairs.sig_regions[i] + pairs.date_regions[i], "signatures and dates are missing")
+        else:
+            sig_is_handwritten, sig_is_color = classify_spans(pairs.sig_spans[i], hands_written_index, color_index)
+            date_is_handwritten, date_is_color = classify_spans(pairs.date_spans[i], hands_written_index, color_index)
+            if pairs.sig_spans[i] and (not sig_is_handwritten):
+                report(pairs.sig_contents[i], pairs.sig_regions[i], "signature is not handwritten")
+            if pairs.date_spans[i] and (not date_is_handwritten):
+                report(pairs.date_contents[i], pairs.date_regions[i], "date is not handwritten")
+            if sig_is_color:
+                report(pairs.sig_contents[i], pairs.sig_regions[i], "signature is not black")
+            if date_is_color:
+                report(pairs.date_contents[i], pairs.date_regions[i], "date is not black")
+            dates.append((pairs.date_keys[i], pairs.date_contents[i], pairs.date_regions[i], len(errors)))
+    
+    return SimpleNamespace(page_number=page_number, errors=errors, dates=dates, signatures=signatures)
+
+
+def check_date_order(
+    checks: SimpleNamespace, 
+    file_name: str, 
+    author_date: str = "", 
+    philips_date: str = ""
+    ) -> list:
+    """
+    Checks that the dates signed on a page are neither ahead of the author date 
+    nor behind the Philips date. The errors are inserted into checks.errors right 
+    after the other errors of the same person or pair, so the page errors keep 
+    the order in which the page is read.
+    Args:
+        checks (SimpleNamespace): The page checks returned by check_page_result.
+        file_name (str): The name of the document file.
+        author_date, philips_date (str): The author and Philips dates of the document.
+    Returns:
+        List[DocumentError]: The errors found.
+    """
+    errors = []
+    # dates are compared as YYYYMMDD integers
+    author_key = parse_date(author_date)
+    philips_key = parse_date(philips_date)
+    if not (author_key or philips_key):
+        return errors
+    
+    page_errors = []
+    previous = 0
+    for date_key, content, bounding_regions, position in checks.dates:
+        if date_key and author_key and (date_key < author_key):
+            error = DocumentError(file_name, content, checks.page_number, bounding_regions, "date is ahead of author date")
             errors.append(error)
             logger.info(error)
-        else:
-            if pair["signature"]["spans"] and (not has_intersection(pair["signature"]["spans"], hands_written_spans)):
-                error = DocumentError(file_name, pair['signature']["content"], page_number, pair['signature']["bounding_regions"], "signature is not handwritten")
-                errors.append(error)
-                logger.info(error)
-            if pair["date"]["spans"] and (not has_intersection(pair["date"]["spans"], hands_written_spans)):
-                error = DocumentError(file_name, pair['date']["content"], page_number, pair['date']["bounding_regions"], "date is not handwritten")
-                errors.append(error)
-                logger.info(error)
-            if pair["signature"]["spans"] and has_intersection(pair["signature"]["spans"], color_spans):
-                error = DocumentError(file_name, pair['signature']["content"], page_number, pair['signature']["bounding_regions"], "signature is not black")
-                errors.append(error)
-                logger.info(error)
-            if pair["date"]["spans"] and has_intersection(pair["date"]["spans"], color_spans):
-                error = DocumentError(file_name, pair['date']["content"], page_number, pair['date']["bounding_regions"], "date is not black")
-                errors.append(error)
-                logger.info(error)
-            formatted_date = format_date(pair["date"]["content"])
-            if formatted_date and author_date and (formatted_date < author_date):
-                error = DocumentError(file_name, pair["date"]["content"], page_number, pair["date"]["bounding_regions"], "date is ahead of author date")
-                errors.append(error)
-                logger.info(error)
-            if formatted_date and philips_date and (formatted_date > philips_date):
-                error = DocumentError(file_name, pair["date"]["content"], page_number, pair["date"]["bounding_regions"], "date is behind philips date")
-                errors.append(error)
-                logger.info(error)
-                
+            # the positions never decrease, as the dates are listed in the order of the errors
+            page_errors.extend(checks.errors[previous:position])
+            page_errors.append(error)
+            previous = position
+        if date_key and philips_key and (date_key > philips_key):
+            error = DocumentError(file_name, content, checks.page_number, bounding_regions, "date is behind philips date")
+            errors.append(error)
+            logger.info(error)
+            page_errors.extend(checks.errors[previous:position])
+            page_errors.append(error)
+            previous = position
     if errors:
-        bounding_regions = [i.bounding_regions for i in errors]
-        bounding_regions = [(idx, item) for idx, sublist in enumerate(bounding_regions) for item in sublist]
-        try:
-            logger.info(f"start ploting on page{page_number} of {file_name}")
-            image_path = os.path.join(config.IMAGE_PATH, os.path.splitext(file_name)[0], f"page{page_number}.png")
-            local_file_path, _ = get_file_name_and_local_path_from_url(file_path)
-            draw_bounding_boxes_on_pdf(
-                local_file_path, 
-                bounding_regions, 
-                image_path, 
-                page_number
-            )
-            image_url = f"{config.SERVER_API}:{config.PORT}/img/{os.path.splitext(file_name)[0]}/page{page_number}.png"
-            logger.info(f"image saved for page{page_number} of {file_name}")
-        except Exception as e:
-            logger.error(f"Error while drawing bounding boxes on page{page_number} of {file_name}: {e}")
-    
+        page_errors.extend(checks.errors[previous:])
+        checks.errors[:] = page_errors
+    return errors
+
+
+def page_image_location(file_name: str, page_number: int) -> tuple:
+    """
+    Returns the local path and the url of the image of the errors found on a page.
+    """
+    document_name = os.path.splitext(file_name)[0]
+    return (
+        os.path.join(_IMAGE_PATH, document_name, f"page{page_number}.{config.IMAGE_FORMAT}"),
+        f"{_IMAGE_URL}/{document_name}/page{page_number}.{config.IMAGE_FORMAT}"
+    )
+
+
+def error_bounding_regions(errors: list) -> list:
+    """
+    Returns the boxes to draw for the errors of a page, as flat (error index, x0, y0, x1, y1) 
+    tuples in inches, taken from the top-left and bottom-right corners of the polygons.
+    """
+    boxes = []
+    for idx, error in enumerate(errors):
+        for region in error.bounding_regions:
+            polygon = region["polygon"]
+            boxes.append((idx, polygon[0]["x"], polygon[0]["y"], polygon[2]["x"], polygon[2]["y"]))
+    return boxes
+
+
+def draw_page_errors(checks: SimpleNamespace, pdf, file_name: str) -> str:
+    """
+    Draws the bounding boxes of the errors found on a page.
+    Args:
+        checks (SimpleNamespace): The page checks, see check_page_result.
+        pdf (str or fitz.Document): The local path to the pdf, or the opened document.
+        file_name (str): The name of the document file.
+    Returns:
+        str: The url of the image, or "" if there is no error or the drawing failed.
+    """
+    if not checks.errors:
+        return ""
+    page_number = checks.page_number
+    try:
+        logger.info("start ploting on page%s of %s", page_number, file_name)
+        image_path, image_url = page_image_location(file_name, page_number)
+        draw_bounding_boxes_on_pdf(pdf, error_bounding_regions(checks.errors), image_path, page_number)
+        logger.info("image saved for page%s of %s", page_number, file_name)
+        return image_url
+    except Exception as e:
+        logger.error("Error while drawing bounding boxes on page%s of %s: %s", page_number, file_name, e)
+        return ""
+
+
+def page_response(
+    checks: SimpleNamespace,
+    file_name: str, 
+    author_date: str = "", 
+    author_cell: dict = None, 
+    philips_date : str = "",
+    philips_cell: dict = None,
+    image_url: str = ""
+    ) -> dict:
+    """
+    Builds the response of a page from its checks and the url of its error image.
+    """
     response = {
         "file_name": file_name,
-        "page_number": page_number, 
+        "page_number": checks.page_number, 
         "results": {
             "author_cell": author_cell,
             "author_date": author_date,
             "philips_cell": philips_cell,
             "philips_date": philips_date,
             "page_image": image_url,
-            "errors": [error.__dict__ for error in errors] if errors else errors
+            "errors": checks.errors
             }
         }
     return response
 
 
+def build_page_response(
+    checks: SimpleNamespace,
+    local_file_path: str, 
+    file_name: str, 
+    author_date: str = "", 
+    author_cell: dict = None, 
+    philips_date : str = "",
+    philips_cell: dict = None,
+    pdf_document: fitz.Document = None
+    ) -> dict:
+    """
+    Draws the bounding boxes of the errors found on a page and builds the page response.
+    The boxes are drawn on pdf_document when given, the pdf is opened from 
+    local_file_path otherwise.
+    """
+    image_url = draw_page_errors(checks, pdf_document or local_file_path, file_name)
+    return page_response(
+        checks, 
+        file_name, 
+        author_date, 
+        author_cell, 
+        philips_date, 
+        philips_cell, 
+        image_url
+        )
+
+
+def verify_page_result(
+    result,
+    local_file_path: str, 
+    file_name: str, 
+    page_number: int,
+    author_date: str = "", 
+    author_cell: dict = None, 
+    philips_date : str = "",
+    philips_cell: dict = None,
+    pdf_document: fitz.Document = None
+    ) -> dict:
+    """
+    Runs the signature/date checks on the analyze result of a single page, draws 
+    the bounding boxes of the errors found and builds the page response.
+    Args:
+        result: The AnalyzeResult of the prebuilt-layout model for the page.
+        local_file_path (str): The local path to the document file the page belongs to.
+        file_name (str): The name of the document file.
+        page_number (int): The page number of the page.
+        author_date, author_cell, philips_date, philips_cell: The author and Philips 
+            signatures found on the first page, used for the date ordering checks.
+        pdf_document (fitz.Document): The opened document to draw on, if already opened.
+    Returns:
+        dict: The page response containing the errors, author and Philips dates and cells.
+    """
+    checks = check_page_result(result, file_name, page_number)
+    if checks.signatures:
+        author_cell, author_date, philips_cell, philips_date = checks.signatures
+    check_date_order(checks, file_name, author_date, philips_date)
+    return build_page_response(
+        checks, 
+        local_file_path, 
+        file_name, 
+        author_date, 
+        author_cell, 
+        philips_date, 
+        philips_cell,
+        pdf_document
+        )
+
+
+def verify_pages_batch(
+    local_file_path: str, 
+    file_name: str, 
+    start_page: int, 
+    end_page: int
+    ) -> list:
+    """
+    Analyzes the pages from start_page to end_page in a single request, instead of 
+    one request per page, then verifies them page by page.
+    Args:
+        local_file_path (str): The local path to the document file to be verified.
+        file_name (str): The name of the document file.
+        start_page (int): The first page to verify.
+        end_page (int): The last page to verify.
+    Returns:
+        list: The page responses in page order, followed by an {"error"} item if a page failed.
+    """
+    logger.debug("begin to process page%s-%s of %s", start_page, end_page, file_name)
+    try:
+        page_results = split_result_by_page(
+            wait_for_result(begin_analysis(local_file_path, f"{start_page}-{end_page}"), f"{start_page}-{end_page}")
+            )
+    except Exception as e:
+        logger.error("Error processing page %s-%s: %s", start_page, end_page, e)
+        return [{"error": str(e)}]
+    logger.debug("page %s-%s of %s parsed!", start_page, end_page, file_name)
+    
+    author_date = ""
+    author_cell = None
+    philips_date = ""
+    philips_cell = None
+    
+    responses = []
+    with fitz.open(local_file_path) as pdf_document:
+        for page_number in range(start_page, end_page + 1):
+            try:
+                page_result = get_page_result(page_results, page_number)
+                checks = check_page_result(page_result, file_name, page_number)
+                if checks.signatures:
+                    author_cell, author_date, philips_cell, philips_date = checks.signatures
+                check_date_order(checks, file_name, author_date, philips_date)
+            except Exception as e:
+                logger.error("Error processing page %s: %s", page_number, e)
+                responses.append({"error": str(e)})
+                break
+            responses.append(build_page_response(
+                checks, 
+                local_file_path, 
+                file_name, 
+                author_date, 
+                author_cell, 
+                philips_date, 
+                philips_cell,
+                pdf_document
+                ))
+    return responses
+
+
 async def verify_single_file(
     queue: asyncio.Queue,
     file_path: str, 
@@ -248,16 +561,41 @@ async def verify_single_file(
     local_file_path, file_name, num_pages = get_pdf_page_number(file_path)
     processed_image_folder = os.path.join(config.IMAGE_PATH, os.path.splitext(file_name)[0])
     os.makedirs(processed_image_folder, exist_ok=True)
-    logger.debug(f"procssed image will be saved in {processed_image_folder}")
+    logger.debug("procssed image will be saved in %s", processed_image_folder)
     
-    logger.info(f"Begin to analyze {file_name}...")
+    logger.info("Begin to analyze %s...", file_name)
     
     start_page = max(min_pages, start_page)
     cancelled = False
+    loop = asyncio.get_running_loop()
+    
+    if config.USE_BATCH_API:
+        # a single request for the whole range, the pdf is only uploaded once
+        end_page = min(max_pages, num_pages)
+        if start_page <= end_page:
+            results = await loop.run_in_executor(
+                _VERIFY_POOL,
+                verify_pages_batch,
+                local_file_path, 
+                file_name, 
+                start_page,
+                end_page
+                )
+            for result in results:
+                await queue.put(result)
+        await queue.put(None)
+        logger.info("Complete analyzing %s.", file_name)
+        return
     
     try:
         if start_page == 1:
-            result = process_page(local_file_path, file_name, start_page)
+            result = await loop.run_in_executor(
+                _VERIFY_POOL,
+                process_page,
+                local_file_path, 
+                file_name, 
+                start_page
+                )
             author_date = result["results"]["author_date"]
             author_cell = result["results"]["author_cell"]
             philips_date = result["results"]["philips_date"]
@@ -270,14 +608,20 @@ async def verify_single_file(
             philips_date = ""
             philips_cell = None
     except Exception as e:
-        logger.error(f"Error processing page {start_page}: {e}")
+        logger.error("Error processing page %s: %s", start_page, e)
         await queue.put({"error": str(e)})
         cancelled = True
-            
+        
     if not cancelled:
-        for page_number in range(start_page, min(max_pages, num_pages) + 1):
-            try:
-                result = await asyncio.to_thread(
+        # the other pages only depend on the first one, at most VERIFY_WORKERS of them 
+        # are verified ahead of the page being sent
+        page_numbers = iter(range(start_page, min(max_pages, num_pages) + 1))
+        pending = deque()
+        
+        def submit(page_numbers_slice):
+            for page_number in page_numbers_slice:
+                pending.append((page_number, loop.run_in_executor(
+                    _VERIFY_POOL,
                     process_page,
                     local_file_path, 
                     file_name, 
@@ -286,20 +630,34 @@ async def verify_single_file(
                     author_cell,
                     philips_date,
                     philips_cell
-                    )
+                    )))
+        
+        try:
+            submit(islice(page_numbers, config.VERIFY_WORKERS))
+            # the results are queued in page order, so that the pages before a failed page are sent
+            while pending:
+                page_number, task = pending.popleft()
+                try:
+                    result = await task
+                except Exception as e:
+                    logger.error("Error processing page %s: %s", page_number, e)
+                    await queue.put({"error": str(e)})
+                    break
+                submit(islice(page_numbers, 1))
                 await queue.put(result)
-            except Exception as e:
-                logger.error(f"Error processing page {page_number}: {e}")
-                await queue.put({"error": str(e)})
-                break
+        finally:
+            # only the pages not started yet can be dropped
+            for _, task in pending:
+                task.cancel()
         
     await queue.put(None)
     
-    logger.info(f"Complete analyzing {file_name}.")
+    logger.info("Complete analyzing %s.", file_name)
     
     
 async def send_single_file_result(queue: asyncio.Queue, next_page = 1):
-    results_buffer = {}  
+    # min-heap of the (page_number, result) received ahead of next_page
+    results_buffer = []
     while True:
         result = await queue.get()
         if not result:
@@ -307,11 +665,11 @@ async def send_single_file_result(queue: asyncio.Queue, next_page = 1):
         if "error" in result:
             yield f"data: {{\"task cancelled\": \"{result['error']}\"}}\n\n"
             break
-        page_number = result["page_number"]
-        results_buffer[page_number] = result
+        heapq.heappush(results_buffer, (result["page_number"], result))
 
-        while next_page in results_buffer:
-            yield f"data: {json.dumps(results_buffer.pop(next_page), ensure_ascii=False)}\n\n"
+        while results_buffer and (results_buffer[0][0] == next_page):
+            _, result = heapq.heappop(results_buffer)
+            yield f"data: {orjson.dumps(result).decode()}\n\n"
             next_page += 1
             
             
@@ -321,7 +679,9 @@ async def process_single_file(
     max_pages: int, 
     start_page: int = 1,
     ):
-    queue = asyncio.Queue()
+    # the producer waits when the client reads slower than the pages are verified,
+    # instead of piling up the page results in memory
+    queue = asyncio.Queue(maxsize=config.SSE_BUFFER_PAGES)
     producer_task = asyncio.create_task(
         verify_single_file(
             queue, 
@@ -339,4 +699,8 @@ async def process_single_file(
                 producer_task.cancel() 
                 break
     finally:
-        await producer_task
\ No newline at end of file
+        # the producer is stopped when the client disconnects, as it would wait forever on the full queue;
+        # it may also have been cancelled above, which is not an error of the stream
+        if not producer_task.done():
+            producer_task.cancel()
+        await asyncio.gather(producer_task, return_exceptions=True)
\ No newline at end of file
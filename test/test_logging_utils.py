@@ -1,12 +1,12 @@
 import json
+import orjson
 import logging
 import pathlib
-from unittest import mock
-from doc_verifier.logging_utils import setup_logging
+from doc_verifier.logging_utils import setup_logging, DocumentError
 
 
 def test_setup_logging(mocker):
-    mock_open = mocker.patch("builtins.open", mock.mock_open(read_data=json.dumps({
+    mock_read_bytes = mocker.patch.object(pathlib.Path, "read_bytes", return_value=json.dumps({
         "version": 1,
         "handlers": {
             "console": {
@@ -25,16 +25,29 @@ def test_setup_logging(mocker):
             "level": "DEBUG",
             "handlers": ["console"]
         }
-    }).replace("{LOG_PATH}", "/tmp/logs")))
+    }).replace("{LOG_PATH}", "/tmp/logs").encode())
 
     mocker.patch("pathlib.Path", return_value=pathlib.Path("/fake/path/to/config.json"))
     mocker.patch("logging.config.dictConfig")
 
     logging_config = setup_logging("/fake/path/to/config.json")
 
-    mock_open.assert_called_once_with(pathlib.Path("/fake/path/to/config.json"))
+    mock_read_bytes.assert_called_once_with()
     logging.config.dictConfig.assert_called_once()
     assert logging_config["version"] == 1
     assert "handlers" in logging_config
     assert "formatters" in logging_config
-    assert "root" in logging_config
\ No newline at end of file
+    assert "root" in logging_config
+
+
+def test_document_error_serialization():
+    error = DocumentError("test.pdf", "31-jan-2024", 2, [{"page_number": 2, "polygon": []}], "date is not black")
+    assert orjson.loads(orjson.dumps(error)) == {
+        "file_name": "test.pdf",
+        "content": "31-jan-2024",
+        "page_number": 2,
+        "bounding_regions": [{"page_number": 2, "polygon": []}],
+        "error_type": "date is not black"
+    }
+    assert not hasattr(error, "__dict__")
+    assert json.loads(repr(error))["error_type"] == "date is not black"
@@ -1,4 +1,9 @@
-from doc_verifier.plot_utils import extract_specific_message_from_log
+import sys
+import types
+import logging
+import pathlib
+from doc_verifier import plot_utils
+from doc_verifier.plot_utils import extract_specific_message_from_log, extract_specific_messages_from_log_file, clear_path
 
 def test_valid_log_line():
     log_line = '[INFO] [2023-10-01 12:00:00] [module] : {"file_name": "test.pdf", "error_type": "missing_text", "page_number": 1, "content": "Some content", "bounding_regions": []}'
@@ -17,4 +22,56 @@ def test_invalid_json_log_line():
 
 def test_missing_required_fields():
     log_line = '[INFO] [2023-10-01 12:00:00] [module] : {"file_name": "test.pdf", "error_type": "missing_text", "page_number": 1, "content": "Some content"}'
-    assert extract_specific_message_from_log(log_line) is None
\ No newline at end of file
+    assert extract_specific_message_from_log(log_line) is None
+
+def test_extract_messages_from_latest_section(tmp_path):
+    def error_line(page_number):
+        return '[2023-10-01 12:00:00] [INFO] [doc_verifier] : {"file_name": "test.pdf", "error_type": "missing_text", "page_number": %d, "content": "", "bounding_regions": []}' % page_number
+    log_file = tmp_path / "verify.log"
+    log_file.write_text("\n".join([
+        "[2023-10-01 12:00:00] [INFO] [doc_verifier] : Begin to analyze all files.",
+        error_line(1),
+        "[2023-10-01 12:00:00] [INFO] [doc_verifier] : Complete analyzing all files.",
+        "[2023-10-01 12:00:01] [INFO] [doc_verifier] : Begin to analyze all files.",
+        error_line(2),
+        "[2023-10-01 12:00:01] [DEBUG] [doc_verifier] : page 2 parsed",
+        error_line(3),
+        "[2023-10-01 12:00:01] [INFO] [doc_verifier] : Complete analyzing all files.",
+        error_line(4),
+    ]))
+    messages = extract_specific_messages_from_log_file(str(log_file))
+    assert [message["page_number"] for message in messages] == [2, 3]
+
+def test_extract_messages_from_empty_log(tmp_path):
+    log_file = tmp_path / "verify.log"
+    log_file.write_text("")
+    assert extract_specific_messages_from_log_file(str(log_file)) == []
+
+def test_valid_log_line_bytes():
+    log_line = b'[2023-10-01 12:00:00] [INFO] [doc_verifier] : {"file_name": "test.pdf", "error_type": "missing_text", "page_number": 1, "content": "\xc3\xa9", "bounding_regions": []}'
+    assert extract_specific_message_from_log(log_line)["content"] == "\u00e9"
+
+def test_clear_path(tmp_path):
+    (tmp_path / "a.png").write_bytes(b"")
+    (tmp_path / "sub" / "nested").mkdir(parents=True)
+    (tmp_path / "sub" / "nested" / "b.png").write_bytes(b"")
+    clear_path(str(tmp_path))
+    assert list(tmp_path.iterdir()) == []
+    clear_path(str(tmp_path / "missing"))
+    assert (tmp_path / "missing").is_dir()
+
+def _logger_handlers():
+    return [type(handler).__name__ for handler in logging.getLogger("doc_verifier").handlers]
+
+def test_render_pool_does_not_set_up_logging_again(monkeypatch):
+    # the server runs as "python doc_verifier/main.py", which the spawned
+    # workers import again as __mp_main__
+    main_script = types.ModuleType("__main__")
+    main_script.__file__ = str(pathlib.Path(plot_utils.__file__).with_name("main.py"))
+    main_script.__spec__ = None
+    monkeypatch.setitem(sys.modules, "__main__", main_script)
+    plot_utils.shutdown_render_pool()
+    try:
+        assert plot_utils.get_render_pool().submit(_logger_handlers).result(timeout=60) == []
+    finally:
+        plot_utils.shutdown_render_pool()
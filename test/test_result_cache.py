@@ -0,0 +1,45 @@
+import os
+import fitz
+from azure.ai.formrecognizer import AnalyzeResult
+from doc_verifier import config
+from doc_verifier.result_cache import page_cache_key, load_result, save_result
+
+
+def _make_pdf(path, texts):
+    with fitz.open() as pdf_document:
+        for text in texts:
+            page = pdf_document.new_page()
+            page.insert_text((72, 72), text)
+        pdf_document.save(path)
+
+
+def test_page_cache_key_depends_on_file_and_page(tmp_path):
+    _make_pdf(tmp_path / "a.pdf", ["first", "second"])
+    _make_pdf(tmp_path / "b.pdf", ["first", "changed"])
+    path = str(tmp_path / "a.pdf")
+    assert page_cache_key(path, 1) == page_cache_key(path, 1)
+    assert page_cache_key(path, 1) != page_cache_key(path, 2)
+    assert page_cache_key(path, 1) != page_cache_key(str(tmp_path / "b.pdf"), 1)
+
+
+def test_page_cache_key_changes_when_file_is_replaced(tmp_path):
+    path = tmp_path / "a.pdf"
+    _make_pdf(path, ["first"])
+    key = page_cache_key(str(path), 1)
+    _make_pdf(tmp_path / "b.pdf", ["changed, and longer"])
+    os.replace(tmp_path / "b.pdf", path)
+    assert page_cache_key(str(path), 1) != key
+
+
+def test_page_cache_key_depends_on_endpoint(tmp_path):
+    _make_pdf(tmp_path / "a.pdf", ["first"])
+    path = str(tmp_path / "a.pdf")
+    assert page_cache_key(path, 1, "https://a.example.com") != page_cache_key(path, 1, "https://b.example.com")
+
+
+def test_save_and_load_result(tmp_path, mocker):
+    mocker.patch.object(config, "CACHE_PATH", str(tmp_path / "cache"))
+    result = AnalyzeResult.from_dict({"api_version": "2023-07-31", "model_id": "prebuilt-layout", "content": "text"})
+    assert load_result("ab12") is None
+    save_result("ab12", result)
+    assert load_result("ab12").to_dict() == result.to_dict()
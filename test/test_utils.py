@@ -0,0 +1,95 @@
+import random
+import pytest
+from types import SimpleNamespace
+from azure.ai.formrecognizer import DocumentStyle, DocumentSpan
+from doc_verifier.utils import interval_hits, parse_date, format_date, signature_columns, classify_spans, filter_blue_colors, extract_relevant_spans, build_span_index, split_result_by_page, get_page_result
+
+
+def test_classify_spans_matches_interval_hits():
+    rnd = random.Random(1)
+    for _ in range(500):
+        hw_index, color_index = (
+            build_span_index({0: [{"offset": rnd.randint(0, 100), "length": rnd.randint(1, 10)} for _ in range(rnd.randint(0, 5))]})
+            for _ in range(2)
+        )
+        spans = [{"offset": rnd.randint(0, 110), "length": rnd.randint(0, 10)} for _ in range(rnd.randint(0, 3))]
+        assert classify_spans(spans, hw_index, color_index) == (interval_hits(hw_index, spans), interval_hits(color_index, spans))
+
+def test_span_index_merges_overlapping_spans():
+    spans_dict = {
+        "#0000ff": [{"offset": 10, "length": 5}, {"offset": 0, "length": 30}],
+        "#0000aa": [{"offset": 40, "length": 2}]
+    }
+    assert build_span_index(spans_dict) == ([0, 40], [30, 42])
+    assert interval_hits(build_span_index(spans_dict), [{"offset": 29, "length": 3}])
+    assert not interval_hits(build_span_index(spans_dict), [{"offset": 30, "length": 10}])
+
+
+def test_parse_date_accepted_formats():
+    assert parse_date("2024-01-31") == 20240131
+    assert parse_date("2024.1-5") == 20240105
+    assert parse_date("2024/1/7") == 20240107
+    assert parse_date("31-Jan-2024") == 20240131
+    assert parse_date("1-dec.2023") == 20231201
+    assert parse_date(" 12 jan, 2024 ") == 20240112
+    assert parse_date("29feb2024") == 20240229
+
+
+def test_parse_date_rejects_invalid_dates():
+    assert parse_date("") == 0
+    assert parse_date("29feb2023") == 0
+    assert parse_date("2024-13-01") == 0
+    assert parse_date("2024/01-31") == 0
+    assert parse_date("31-jxn-2024") == 0
+
+
+def test_format_date_returns_iso_string():
+    assert format_date("7jan2024") == "2024-01-07"
+    assert format_date("bad") == ""
+
+
+def test_signature_columns_transposes_persons():
+    persons = [
+        {"role": "author", "signature": {"content": "john", "spans": [{"offset": 0, "length": 4}], "bounding_regions": []},
+         "date": {"content": "31-jan-2024", "spans": [], "bounding_regions": [{"page_number": 1}]}},
+        {"signature": {"content": "", "spans": [], "bounding_regions": []},
+         "date": {"content": "", "spans": [], "bounding_regions": []}}
+    ]
+    columns = signature_columns(persons)
+    assert columns.roles == ["author", ""]
+    assert columns.is_philips == [False, False]
+    assert columns.sig_contents == ["john", ""]
+    assert columns.sig_spans == [[{"offset": 0, "length": 4}], []]
+    assert columns.date_regions == [[{"page_number": 1}], []]
+    assert columns.date_keys == [20240131, 0]
+
+def test_filter_blue_colors():
+    assert filter_blue_colors("#2030ee")
+    assert filter_blue_colors("0000ff")
+    assert not filter_blue_colors("#000000")
+    assert not filter_blue_colors("#00ffff")
+    assert not filter_blue_colors("#ff00aa")
+
+def test_extract_relevant_spans():
+    def style(is_handwritten, color, offset):
+        return DocumentStyle(is_handwritten=is_handwritten, color=color, spans=[DocumentSpan(offset=offset, length=2)], confidence=1.0)
+    result = SimpleNamespace(styles=[
+        style(True, None, 0),
+        style(None, "#0000ff", 10),
+        style(True, "#112288", 20),
+        style(False, "#ff0000", 30),
+        style(None, "#0000ff", 5),
+    ])
+    hands_written_spans, color_spans = extract_relevant_spans(result)
+    assert hands_written_spans == {True: [{"offset": 0, "length": 2}, {"offset": 20, "length": 2}]}
+    assert color_spans == {
+        "#0000ff": [{"offset": 10, "length": 2}, {"offset": 5, "length": 2}],
+        "#112288": [{"offset": 20, "length": 2}]
+    }
+
+def test_get_page_result_missing_page():
+    page = SimpleNamespace(page_number=2)
+    page_results = split_result_by_page(SimpleNamespace(pages=[page], tables=[], styles=[]))
+    assert get_page_result(page_results, 2).pages == [page]
+    with pytest.raises(ValueError):
+        get_page_result(page_results, 3)